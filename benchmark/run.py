@@ -0,0 +1,189 @@
+import os
+import sys
+
+# The benchmark drives the src package next to the overview stage, like the root main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "v1 (overview)"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")  # Never used, the model is stubbed
+# tiktoken downloads its encoding on first use; keeping it next to the benchmark lets later runs go offline
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tiktoken"))
+
+from collections import defaultdict
+from typing import Callable, Dict, List
+from langchain.chains import create_extraction_chain
+import argparse
+import functools
+import inspect
+import json
+import logging
+import threading
+import tiktoken
+import time
+import tracemalloc
+
+from src.agent import Agent
+from src.crawler import Crawler
+from src.db import WriteBuffer
+from src.pipeline import PageTask
+from src.runner import StageRunner
+from src import metrics
+from server import CorpusServer
+from stubs import MemoryDB, StubChatModel
+
+
+STEPS = ["fetch", "clean", "extract", "write", "db_write"]
+
+
+
+class Timings:
+    """
+    The latencies of each step of a benchmark run, safe to record from many threads.
+    """
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+
+    def record(self, step: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[step].append(seconds)
+
+
+    def timed(self, step: str, fn: Callable) -> Callable:
+        # wraps a step function, sync or async, to record its latency
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.record(step, time.perf_counter() - started)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(step, time.perf_counter() - started)
+        return wrapper
+
+
+    def percentile(self, step: str, q: float) -> float:
+        samples = sorted(self.samples.get(step, []))
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def build(args, timings: Timings):
+    # a stage wired like main.py, on the stub model and the in-memory database
+    mysql = MemoryDB(write_latency=args.db_latency, on_write=lambda seconds: timings.record("db_write", seconds))
+    crawler = Crawler(mysql, timeout=20)
+    crawler.tiers = {}
+    agent = Agent(model="gpt-3.5-turbo-1106", max_workers=args.workers)
+    agent.llm = StubChatModel(latency=args.llm_latency, per_token=args.llm_per_token)
+    agent.chain = create_extraction_chain(schema=agent.schema, llm=agent.llm)
+    writer = WriteBuffer(mysql, max_sources=100, max_rows=5000, max_delay=5.0)
+    stage = StageRunner("overview", mysql, crawler, agent, writer, listings_only=True)
+    for step in ("clean", "extract", "write"):
+        setattr(stage, step, timings.timed(step, getattr(stage, step)))
+    crawler.fetch = timings.timed("fetch", crawler.fetch)
+    crawler.fetch_async = timings.timed("fetch", crawler.fetch_async)
+    return mysql, crawler, agent, writer, stage
+
+
+def run_sequential(stage: StageRunner, pages) -> None:
+    # the original path: fetch, clean, extract and write one page after the other
+    for client_id, url in pages:
+        task = PageTask(client_id, stage.crawler.fetch(url), table=stage.table)
+        task = stage.extract(stage.clean(task))
+        stage.write(task)
+    stage.writer.flush()
+
+
+def run_mode(args, mode: str, concurrency: int, urls: List[str]) -> Dict:
+    timings = Timings()
+    metrics.REGISTRY.reset()
+    mysql, crawler, agent, writer, stage = build(args, timings)
+    stage.concurrency, stage.per_host, stage.min_delay = concurrency, concurrency, 0.0
+    pages = [(i, url) for i, url in enumerate(urls)]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        if mode == "sequential":
+            run_sequential(stage, pages)
+        else:
+            stage.run(pages)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        writer.close()
+        agent.close()
+        crawler.close()
+
+    written = sum(stage.paths.values())
+    tokens = sum(metrics.TOKENS.summary().values())
+    return {
+        "mode": mode if mode == "sequential" else f"{mode} x{concurrency}",
+        "pages": written,
+        "seconds": round(elapsed, 2),
+        "pages_per_second": round(written / elapsed, 2) if elapsed else 0.0,
+        "latency": {step: {"p50": round(timings.percentile(step, 0.5), 4), "p95": round(timings.percentile(step, 0.95), 4)} for step in STEPS},
+        "tokens_per_page": round(tokens / written, 1) if written else 0.0,
+        "dollars": round(sum(metrics.DOLLARS.summary().values()), 4),
+        "paths": dict(stage.paths),
+        "peak_memory_mb": round(peak / (1024 * 1024), 1),
+    }
+
+
+def report(results: List[Dict]) -> None:
+    header = f"{'mode':<16}{'pages':>6}{'pages/s':>9}" + "".join(f"{step + ' p50/p95':>22}" for step in STEPS) + f"{'tokens/page':>13}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        latency = "".join(f"{result['latency'][step]['p50'] * 1000:>11.0f}/{result['latency'][step]['p95'] * 1000:<7.0f}ms  " for step in STEPS)
+        print(f"{result['mode']:<16}{result['pages']:>6}{result['pages_per_second']:>9}{latency}{result['tokens_per_page']:>11}{result['peak_memory_mb']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the crawl stage on recorded pages, a stub model and an in-memory database.")
+    parser.add_argument("--pages", type=int, default=40, help="Pages crawled per mode, cycling through the corpus")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[4, 8], help="Pages in flight of each concurrent mode")
+    parser.add_argument("--workers", type=int, default=8, help="Chunks extracted at once by the agent")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stub model call")
+    parser.add_argument("--llm-per-token", type=float, default=0.0, help="Additional seconds per prompt token of a call")
+    parser.add_argument("--server-latency", type=float, default=0.05, help="Seconds before the corpus server answers")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per write transaction")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # The agent counts tokens with cl100k_base, which needs network access once to be cached
+    try:
+        tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        parser.error(f"the cl100k_base encoding is not in {os.environ['TIKTOKEN_CACHE_DIR']} and could not be downloaded ({type(e).__name__}); run once with network access, or copy a tiktoken cache there")
+
+    # The per-page logs of the stage would drown the report
+    logging.getLogger("Job").setLevel(logging.WARNING)
+
+    server = CorpusServer(latency=args.server_latency)
+    base = server.start()
+    try:
+        urls = server.urls(base, args.pages)
+        results = [run_mode(args, "sequential", 1, urls)]
+        results += [run_mode(args, "concurrent", concurrency, urls) for concurrency in args.concurrency]
+    finally:
+        server.close()
+
+    report(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
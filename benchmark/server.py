@@ -0,0 +1,98 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import os
+import threading
+import time
+
+
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+
+
+class CorpusServer:
+    """
+    Serves the recorded pages of the benchmark corpus on a local port.
+
+    Every page is reachable under any number of distinct URLs,
+    /<n>/<name>.html, so a run can crawl more pages than the corpus holds
+    without the caches of the crawler noticing.
+    """
+
+    def __init__(self, directory: str = PAGES, latency: float = 0.0) -> None:
+        """
+        Loads the corpus into memory without listening yet.
+
+        Args:
+            directory (str): The directory of the recorded pages. Defaults to the bundled corpus.
+            latency (float): The seconds the server waits before answering, like a remote host. Defaults to 0.0.
+
+        Returns:
+            None
+        """
+        self.latency = latency
+        self.pages = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".html"):
+                with open(os.path.join(directory, name), "rb") as file:
+                    self.pages[name] = file.read()
+        self._server = None
+
+
+    def start(self) -> str:
+        """
+        Starts serving from a daemon thread on a free port.
+
+        Returns:
+            str: The base URL of the server.
+        """
+        pages, latency = self.pages, self.latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = pages.get(self.path.split("?")[0].rsplit("/", 1)[-1])
+                if latency:
+                    time.sleep(latency)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="corpus", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+
+    def urls(self, base: str, count: int) -> List[str]:
+        """
+        Returns `count` distinct URLs cycling through the corpus.
+
+        Args:
+            base (str): The base URL returned by `start`.
+            count (int): The number of URLs.
+
+        Returns:
+            list: The URLs.
+        """
+        names = list(self.pages)
+        return [f"{base}/{i}/{names[i % len(names)]}" for i in range(count)]
+
+
+    def close(self) -> None:
+        """
+        Stops the server.
+
+        Returns:
+            None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
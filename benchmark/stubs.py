@@ -0,0 +1,105 @@
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import re
+import threading
+import time
+
+
+# Links of the cleaned page text that point at a job, as html2text writes them
+JOB_LINK = re.compile(r"\[([^\]\n]{3,80})\]\((\S*(?:job|career|position)\S*?)\)", re.I)
+
+
+
+class StubChatModel(BaseChatModel):
+    """
+    A deterministic stand-in for ChatOpenAI.
+
+    Answers the extraction chain's function call with one job per job link
+    in the passage, after sleeping `latency` seconds plus `per_token` seconds
+    per prompt token, and reports token usage like the OpenAI API so costs
+    are counted. Tokens are estimated as four characters each.
+    """
+
+    latency: float = 0.5
+    per_token: float = 0.0
+    model_name: str = "gpt-3.5-turbo-1106"
+
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        passage = messages[-1].content
+        prompt_tokens = sum(len(message.content) for message in messages) // 4
+        time.sleep(self.latency + self.per_token * prompt_tokens)
+        jobs = [
+            {"job_title": title.strip(), "job_description": f"{title.strip()} at the company of the passage", "job_page_url": url}
+            for title, url in dict.fromkeys(JOB_LINK.findall(passage))
+        ]
+        arguments = json.dumps({"info": jobs})
+        message = AIMessage(content="", additional_kwargs={"function_call": {"name": "information_extraction", "arguments": arguments}})
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(arguments) // 4, "total_tokens": prompt_tokens + len(arguments) // 4}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": usage, "model_name": self.model_name})
+
+
+
+class MemoryDB:
+    """
+    A local stand-in for DB covering what a crawl stage calls.
+
+    Keeps job rows, fingerprints and fetch tiers in memory and sleeps
+    `write_latency` seconds plus `row_latency` seconds per row in each write
+    transaction, like a database server on the network.
+    """
+
+    def __init__(self, write_latency: float = 0.02, row_latency: float = 0.0002, on_write: Optional[Callable[[float], None]] = None) -> None:
+        """
+        Initializes an empty database.
+
+        Args:
+            write_latency (float): The seconds of one write transaction. Defaults to 0.02.
+            row_latency (float): The additional seconds per written row. Defaults to 0.0002.
+            on_write (callable, optional): Called with the seconds of each write transaction. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.write_latency = write_latency
+        self.row_latency = row_latency
+        self.on_write = on_write
+        self.rows: Dict[Tuple[str, str], List[Tuple]] = {}
+        self.fingerprints: Dict[Tuple[str, str], Tuple[str, List[Dict]]] = {}
+        self.tiers: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+
+    def get_fingerprint(self, source: str, table: str = "overview") -> Optional[Tuple[str, List[Dict]]]:
+        with self._lock:
+            return self.fingerprints.get((table, source))
+
+
+    def get_fetch_tiers(self, stage: str, reprobe_days: int = 7) -> Dict[str, str]:
+        with self._lock:
+            return dict(self.tiers)
+
+
+    def save_fetch_tiers(self, tiers: Dict[str, str], stage: str) -> None:
+        with self._lock:
+            self.tiers.update(tiers)
+
+
+    def write_batch(self, sources: Dict[Tuple[str, str], List[Tuple]], fingerprints: Dict = None, batch_size: int = 200, feed_queue: bool = False, drain_queue: Optional[str] = None) -> Dict[str, int]:
+        started = time.perf_counter()
+        rows = sum(len(data) for data in sources.values())
+        time.sleep(self.write_latency + self.row_latency * rows)
+        with self._lock:
+            inserted = sum(len(data) for key, data in sources.items() if key not in self.rows)
+            self.rows.update(sources)
+            self.fingerprints.update(fingerprints or {})
+        if self.on_write is not None:
+            self.on_write(time.perf_counter() - started)
+        return {"inserted": inserted, "updated": 0, "deleted": 0, "unchanged": rows - inserted}
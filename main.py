@@ -0,0 +1,168 @@
+import os
+import sys
+
+# Both stages run on the same src package; the copy next to the overview stage is used
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "v1 (overview)"))
+
+from src.agent import Agent
+from src.browser import AsyncBrowserPool
+from src.blocking import ResourceBlocker
+from src.cache import ChunkCache, ResponseCache
+from src.ratelimit import RateLimiter
+from src.crawler import Crawler
+from src.pagination import Paginator
+from src.fetcher import HttpFetcher
+from src.politeness import HostLimiter
+from src.db import DB, WriteBuffer
+from src.recrawl import RecrawlPolicy
+from src.runner import StageRunner, log_summary
+from src.scheduler import Scheduler
+from src import metrics
+import threading
+import atexit
+import signal
+
+
+# Images, media, fonts and trackers are not needed to read the jobs
+resource_blocker = ResourceBlocker(
+    profile="lean",  # "none", "images", "lean" or "strict" (also stylesheets and embedded players)
+    overrides={},  # Profiles of sites that break under the default, e.g. {"example.com": "images"}
+)
+
+# Warm browsers shared by both stages
+browser_pool = AsyncBrowserPool(size=2, headless=True, max_pages=50, blocker=resource_blocker)
+atexit.register(browser_pool.close)
+
+# Keep-alive HTTP connections shared by both stages
+http_fetcher = HttpFetcher(timeout=20)
+
+# Politeness limits shared by both stages, so a host is not hit twice as often
+host_limiter = HostLimiter(concurrency=12, per_host=2, min_delay=1.0)
+
+# OpenAI quota shared by every extraction call of both stages
+rate_limiter = RateLimiter(requests_per_minute=3500, tokens_per_minute=90000)
+
+# Drain the pipelines on SIGTERM the same way as on Ctrl+C
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+# Latency and cost metrics at http://127.0.0.1:9100/metrics
+metrics.REGISTRY.serve(port=9100)
+atexit.register(metrics.REGISTRY.close)
+
+
+# Setup for the MySQL database connections, shared by both stages
+mysql = DB(
+    server="localhost",
+    user="user",
+    password="pass",
+    db="jobs",
+    max_age = 2,        # days
+    min_connections=2,  # Kept open between runs
+    max_connections=8,  # Pipeline threads of both stages writing at once
+    recrawl=RecrawlPolicy(min_hours=1.0, max_hours=24 * 14),  # Pages that keep changing are recrawled sooner, static ones later
+)
+atexit.register(mysql.close_connection)
+
+# Create or upgrade the tables and indexes once, before any run
+mysql.migrate()
+
+
+def wake_individual(written):
+    # New or changed overview rows queue their job pages in the same flush
+    if written["inserted"] or written["updated"]:
+        individual_scheduler.wake()
+
+
+# Job records of each stage written in batches, flushed again at exit
+overview_writer = WriteBuffer(
+    mysql,
+    feed_queue=True,  # Queue new and changed job pages for the individual stage
+    drain_queue="url_schedule",  # Schedule the crawled websites for their next crawl
+    on_flush=wake_individual,  # Crawl the queued job pages right away
+)
+atexit.register(overview_writer.close)
+individual_writer = WriteBuffer(
+    mysql,
+    drain_queue="job_queue",  # Schedule the crawled job pages for their next crawl
+)
+atexit.register(individual_writer.close)
+
+# Extraction results of unchanged chunks
+chunk_cache = ChunkCache(".cache/chunks.sqlite", max_bytes=256 * 1024 * 1024)
+atexit.register(chunk_cache.close)
+
+# Page bodies and validators, so unchanged pages are answered with a 304
+response_cache = ResponseCache(".cache/responses.sqlite", max_bytes=512 * 1024 * 1024)
+atexit.register(response_cache.close)
+
+# One agent and model client for both stages
+job_agent = Agent(
+    model="gpt-3.5-turbo-1106",  # AI model identifier
+    organization="org-8Y92VdA7tV3akhIJIG5eFOI4",  # Organization ID under which the model operates
+    cache=chunk_cache,  # Extraction results of unchanged chunks
+    rate_limiter=rate_limiter,  # Requests/tokens per minute budget of the model
+    max_workers=8,  # Chunks extracted concurrently across pages of both stages
+)
+atexit.register(job_agent.close)
+
+# Scroll, click "load more" and follow next pages until a job board stops growing;
+# job pages are read as they load
+paginator = Paginator(
+    max_steps=20,  # Actions per page at most
+    max_seconds=30.0,  # Seconds per page at most
+)
+
+# Fetch, extract and write pipelines of the 'overview' and 'individual' tables
+overview = StageRunner(
+    "overview",
+    mysql,
+    Crawler(mysql, stage="overview", async_pool=browser_pool, http=http_fetcher, responses=response_cache, limiter=host_limiter, paginator=paginator),
+    job_agent,
+    overview_writer,
+    listings_only=True,  # Send only the job listing parts of a page
+)
+individual = StageRunner(
+    "individual",
+    mysql,
+    Crawler(mysql, stage="individual", async_pool=browser_pool, http=http_fetcher, responses=response_cache, limiter=host_limiter),
+    job_agent,
+    individual_writer,
+    listings_only=False,  # Keep the whole job page, it has no listings
+)
+
+
+def report():
+
+    # Report the caches, pruning, writes and connections so far
+    log_summary(mysql, job_agent, [overview_writer, individual_writer], response_cache)
+
+    # Write where the time and money went since the start, for later comparison
+    metrics.REGISTRY.write_summary("metrics/run.json")
+
+
+# Crawl the websites of the urls table and the job pages found on them as
+# they become due; each stage runs one batch after the other
+overview_scheduler = Scheduler(
+    mysql,
+    overview,
+    queue="url_schedule",
+    sync=mysql.sync_url_schedule,  # Pick up websites added to the urls table
+    on_batch=report,
+)
+individual_scheduler = Scheduler(
+    mysql,
+    individual,
+    queue="job_queue",
+    on_batch=report,
+)
+
+# Individual job pages are crawled in a thread as soon as they are queued
+individual_thread = threading.Thread(target=individual_scheduler.run, name="individual", daemon=True)
+individual_thread.start()
+
+try:
+    overview_scheduler.run()
+finally:
+    # Let the individual stage write what it already fetched
+    individual_scheduler.stop()
+    individual_thread.join()
@@ -1,81 +1,135 @@
-import time
 from src.agent import Agent
+from src.browser import AsyncBrowserPool
+from src.blocking import ResourceBlocker
+from src.cache import ChunkCache, ResponseCache
+from src.ratelimit import RateLimiter
 from src.crawler import Crawler
-from src.db import DB
-import datetime
-import random
-import schedule
-from urllib.parse import urljoin
-
-
-
-def make_abs_url(base, url):
-    if url:
-        if url.startswith("http"):
-            return url
-        else:
-            return urljoin(base, url)
-
-
-def run_job():
-
-    # Setup for the MySQL database connection
-    mysql = DB(
-        server="localhost",
-        user="user",
-        password="pass",
-        db="jobs",
-        max_age = 2         # days
-    )
-    # List of websites to scrape job data from
-    websites = mysql.get_urls(table="urls")
-
-
-    # Initialize agent for job information extraction using a specific AI model
-    job_agent = Agent(
-        model="gpt-3.5-turbo-1106",  # AI model identifier
-        organization="org-8Y92VdA7tV3akhIJIG5eFOI4",  # Organization ID under which the model operates
-    )
-
-
-    # Initialize crawler for website scraping
-    crawler = Crawler(mysql)
-
-    # Iterate over websites to scrape job data
-    for client_id, response in crawler.crawl(websites):
-        # Record the start time of the scraping process
-        start_time = datetime.datetime.now()
-
-        # Extract job information from the crawled response
-        jobs = job_agent.extract_jobs(response)
-
-        # Record the end time of the scraping process
-        end_time = datetime.datetime.now()
-
-        # Prepare job records for database insertion
-        records = [
-            (
-                client_id,  # Random ID for the job record
-                job["job_title"],          # Extracted job title
-                job["job_description"],    # Extracted job description
-                job["token_cost"],         # Associated cost in tokens for the job
-                start_time,                # Scraping process start time
-                end_time,                  # Scraping process end time
-                make_abs_url(response.url, job.get("job_page_url",'')),       # Extracted job page url
-                response.url               # Source of the job
-            )
-            for job in jobs  # Loop through each job extracted
-        ]
-
-        # Insert the job records into the 'overview' table of the database
-        mysql.insert(records, table="overview", duplicates_key=response.url)
-        
-
-
-run_job()
-
-schedule.every().minute.do(run_job)
-
-while True:
-    schedule.run_pending()
-    time.sleep(5)
\ No newline at end of file
+from src.pagination import Paginator
+from src.fetcher import HttpFetcher
+from src.db import DB, WriteBuffer
+from src.recrawl import RecrawlPolicy
+from src.runner import StageRunner, log_summary
+from src.scheduler import Scheduler
+from src import metrics
+import atexit
+import signal
+
+
+# Images, media, fonts and trackers are not needed to read the jobs
+resource_blocker = ResourceBlocker(
+    profile="lean",  # "none", "images", "lean" or "strict" (also stylesheets and embedded players)
+    overrides={},  # Profiles of sites that break under the default, e.g. {"example.com": "images"}
+)
+
+# Warm browsers shared by every scheduled run
+browser_pool = AsyncBrowserPool(size=2, headless=True, max_pages=50, blocker=resource_blocker)
+atexit.register(browser_pool.close)
+
+# Keep-alive HTTP connections shared by every scheduled run
+http_fetcher = HttpFetcher(timeout=20)
+
+# OpenAI quota shared by every extraction call
+rate_limiter = RateLimiter(requests_per_minute=3500, tokens_per_minute=90000)
+
+# Drain the pipeline on SIGTERM the same way as on Ctrl+C
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+# Latency and cost metrics at http://127.0.0.1:9101/metrics
+metrics.REGISTRY.serve(port=9101)
+atexit.register(metrics.REGISTRY.close)
+
+
+# Setup for the MySQL database connections, shared by every scheduled run
+mysql = DB(
+    server="localhost",
+    user="user",
+    password="pass",
+    db="jobs",
+    max_age = 2,        # days
+    min_connections=1,  # Kept open between runs
+    max_connections=4,  # Pipeline threads writing at once
+    recrawl=RecrawlPolicy(min_hours=1.0, max_hours=24 * 14),  # Pages that keep changing are recrawled sooner, static ones later
+)
+atexit.register(mysql.close_connection)
+
+# Create or upgrade the tables and indexes once, before any run
+mysql.migrate()
+
+# Job records of many pages written together, flushed again at exit
+writer = WriteBuffer(
+    mysql,
+    max_sources=100,
+    max_rows=5000,
+    max_delay=5.0,
+    feed_queue=True,  # Queue new and changed job pages for the individual stage
+    drain_queue="url_schedule",  # Schedule the crawled websites for their next crawl
+)
+atexit.register(writer.close)
+
+# Extraction results of unchanged chunks
+chunk_cache = ChunkCache(".cache/chunks.sqlite", max_bytes=256 * 1024 * 1024)
+atexit.register(chunk_cache.close)
+
+# Page bodies and validators, so unchanged pages are answered with a 304
+response_cache = ResponseCache(".cache/responses.sqlite", max_bytes=512 * 1024 * 1024)
+atexit.register(response_cache.close)
+
+# Initialize agent for job information extraction using a specific AI model
+job_agent = Agent(
+    model="gpt-3.5-turbo-1106",  # AI model identifier
+    organization="org-8Y92VdA7tV3akhIJIG5eFOI4",  # Organization ID under which the model operates
+    cache=chunk_cache,  # Extraction results of unchanged chunks
+    rate_limiter=rate_limiter,  # Requests/tokens per minute budget of the model
+    max_workers=8,  # Chunks extracted concurrently across pages
+)
+atexit.register(job_agent.close)
+
+# Scroll, click "load more" and follow next pages until a job board stops growing
+paginator = Paginator(
+    max_steps=20,  # Actions per page at most
+    max_seconds=30.0,  # Seconds per page at most
+)
+
+# Initialize crawler for website scraping on the shared warm browsers
+crawler = Crawler(mysql, stage="overview", async_pool=browser_pool, http=http_fetcher, responses=response_cache, paginator=paginator)
+
+
+# Fetch, extract and write pipeline of the 'overview' table
+stage = StageRunner(
+    "overview",
+    mysql,
+    crawler,
+    job_agent,
+    writer,
+    listings_only=True,  # Send only the job listing parts of a page
+    concurrency=8,  # Pages fetched at once
+    per_host=2,  # Pages fetched at once from the same host
+    min_delay=1.0,  # Seconds between two fetches to the same host
+)
+
+
+def report():
+
+    # Report the caches, pruning, writes and connections of the last batch
+    log_summary(mysql, job_agent, [writer], response_cache)
+    chunk_cache.reset_stats()
+    response_cache.reset_stats()
+    job_agent.reset_stats()
+    writer.reset_stats()
+
+    # Write where the time and money went since the start, for later comparison
+    metrics.REGISTRY.write_summary("metrics/overview.json")
+
+
+# Crawl the websites of the urls table as they become due, one batch after the other
+scheduler = Scheduler(
+    mysql,
+    stage,
+    queue="url_schedule",
+    batch_size=100,  # Pages claimed at once
+    idle=60.0,  # Longest sleep in seconds when nothing is due
+    sync=mysql.sync_url_schedule,  # Pick up websites added to the urls table
+    sync_every=300.0,  # Seconds between two checks of the urls table
+    on_batch=report,
+)
+scheduler.run()
@@ -4,11 +4,22 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.document_transformers import Html2TextTransformer
 from langchain.docstore.document import Document
 from langchain.callbacks import get_openai_callback
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import threading
+import tiktoken
+import time
+import hashlib
 import logging
 
 from src.crawler import Response
+from src.cache import ChunkCache
+from src.ratelimit import RateLimiter
+from src.prune import prune
+from src import extractors
+from src import metrics
+from src.logger import logger
 load_dotenv()
 logging.getLogger("langchain").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -28,15 +39,44 @@ class Agent:
         "required": ["job_title", "job_description", "job_page_url"],
     }
 
-    def __init__(self, model: str = "gpt-3.5-turbo", organization: str = None, temperature: float = 0.0):
+    def __init__(self, model: str = "gpt-3.5-turbo", organization: str = None, temperature: float = 0.0, cache: ChunkCache = None, rate_limiter: RateLimiter = None, max_workers: int = 4, completion_tokens: int = 1024, prune_listings: bool = False, chunk_tokens: int = 15360, pruning_sample: int = 20):
         """
         Initializes a new instance of the Agent class.
 
+        The encoder, splitter, HTML converter and extraction chain are built
+        once and shared by all threads; none of them keeps state between calls.
+        Long pages are cut into chunks of about `chunk_tokens` / 2 tokens, see `split`.
+
         Args:
             model (str): The name of the GPT-3 model to use. Defaults to "gpt-3.5-turbo".
             organization (str): The name of the OpenAI organization to use. Defaults to None.
             temperature (float): The temperature to use when generating responses. Defaults to 0.0.
+            cache (ChunkCache): A cache of extraction results per chunk. Defaults to None (no caching).
+            rate_limiter (RateLimiter): The request and token budget shared by all calls. Defaults to None (unlimited).
+            max_workers (int): The number of chunks extracted concurrently, across pages. Defaults to 4.
+            completion_tokens (int): The completion tokens reserved per call on top of the prompt. Defaults to 1024.
+            prune_listings (bool): Whether to keep only the parts of a page that look like job listings. Defaults to False.
+            chunk_tokens (int): The most tokens sent in one call; longer pages are split. Defaults to 15360.
+            pruning_sample (int): Measure the savings of pruning on one page in this many. Defaults to 20.
         """
+        self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.completion_tokens = completion_tokens
+        self.chunk_tokens = chunk_tokens
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        self.prune_listings = prune_listings
+        self.pruning_sample = pruning_sample
+        self.pruning = {"pages": 0, "sampled": 0, "tokens_before": 0, "tokens_after": 0}
+        self.timings = {step: {"calls": 0, "seconds": 0.0} for step in ("clean", "split", "extract")}
+        self._stats_lock = threading.Lock()
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=0,
+            length_function=self.count_tokens,
+        )
+        self.html2text = Html2TextTransformer(ignore_links=False)
         self.llm = ChatOpenAI(
             organization=organization,
             model_name=model,
@@ -44,28 +84,125 @@ class Agent:
             request_timeout=30,
             max_retries=3
         )
+        self.chain = create_extraction_chain(schema=self.schema, llm=self.llm)
+
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Counts the tokens of a text with the shared encoder.
 
+        Args:
+            text (str): The text to count.
 
-    def clean(self, response: Response) -> str:
+        Returns:
+            int: The number of tokens, special token markers counted as plain text.
+        """
+        with metrics.TOKENIZATION.time():
+            return len(self.encoding.encode_ordinary(text))
+
+
+    def _timed(self, step: str, started: float) -> None:
+        with self._stats_lock:
+            self.timings[step]["calls"] += 1
+            self.timings[step]["seconds"] += time.perf_counter() - started
+
+
+    def clean(self, response: Response, listings_only: Optional[bool] = None) -> str:
         """
         Cleans the HTML content of a response object by removing unwanted tags.
 
+        The page is pruned of boilerplate before the conversion to text. On one
+        page in `pruning_sample`, the unpruned page is converted as well and the
+        token counts with and without pruning are recorded, see `pruning_summary`.
+
         Args:
             response: The response object containing the HTML content to be cleaned.
+            listings_only (bool, optional): Whether to keep only the job listings of the page. Defaults to the agent's `prune_listings`.
 
         Returns:
             str: The cleaned text content of the HTML.
         """
         if response:
-            html2text_obj = Html2TextTransformer(ignore_links=False)
-            docs = html2text_obj.transform_documents([
-                Document(page_content=response.text, metadata={"source": response.url})
-            ])
+            started = time.perf_counter()
+            with self._stats_lock:
+                sampled = self.pruning["pages"] % self.pruning_sample == 0
+                self.pruning["pages"] += 1
+            with metrics.HTML2TEXT.time():
+                documents = [Document(page_content=prune(response.text, listings_only=self.prune_listings if listings_only is None else listings_only), metadata={"source": response.url})]
+                if sampled:
+                    documents.append(Document(page_content=response.text, metadata={"source": response.url}))
+                docs = self.html2text.transform_documents(documents)
+            if sampled:
+                after = self.count_tokens(docs[0].page_content)
+                before = self.count_tokens(docs[1].page_content)
+                with self._stats_lock:
+                    self.pruning["sampled"] += 1
+                    self.pruning["tokens_before"] += before
+                    self.pruning["tokens_after"] += after
+                logger.info(f"Pruned {response.url}: {before} -> {after} tokens")
+            self._timed("clean", started)
             return docs[0].page_content + ' ' + response.url 
         else:
             return ""
 
 
+    def pruning_summary(self) -> Dict:
+        """
+        Summarizes the token savings of pruning over the pages cleaned so far.
+
+        Returns:
+            dict: The page count, the sampled page count, the tokens of the sampled pages before and after pruning, and the fraction saved.
+        """
+        with self._stats_lock:
+            before, after = self.pruning["tokens_before"], self.pruning["tokens_after"]
+            return {**self.pruning, "saved": round(1 - after / before, 3) if before else 0.0}
+
+
+    def timing_summary(self) -> Dict:
+        """
+        Summarizes the time spent cleaning, splitting and extracting pages so far.
+
+        Returns:
+            dict: The calls, total seconds and average milliseconds of each step.
+        """
+        with self._stats_lock:
+            return {
+                step: {
+                    "calls": timing["calls"],
+                    "seconds": round(timing["seconds"], 2),
+                    "average_ms": round(timing["seconds"] * 1000 / timing["calls"], 1) if timing["calls"] else 0.0,
+                }
+                for step, timing in self.timings.items()
+            }
+
+
+    def reset_stats(self) -> None:
+        """
+        Resets the pruning counters and timings, e.g. at the start of a run.
+
+        Returns:
+            None
+        """
+        with self._stats_lock:
+            self.pruning = {"pages": 0, "sampled": 0, "tokens_before": 0, "tokens_after": 0}
+            self.timings = {step: {"calls": 0, "seconds": 0.0} for step in self.timings}
+
+
+    @staticmethod
+    def fingerprint(text: str) -> str:
+        """
+        Computes a fingerprint of cleaned page text that ignores whitespace differences.
+
+        Args:
+            text (str): The cleaned text content, see `clean`.
+
+        Returns:
+            str: The hex SHA-256 digest of the normalized text.
+        """
+        normalized = " ".join(text.split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
     def extract_jobs(self, response: Response) -> List[Dict]:
         """
         Extracts job information from the given page using the extraction chain.
@@ -76,24 +213,144 @@ class Agent:
         Returns:
             List: A list of dictionaries containing the extracted jobs information.
         """
-        text = self.clean(response)
+        _, jobs = self.extract_structured(response)
+        return jobs or self.extract_text(self.clean(response))[0]
 
-        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=15360,
-            chunk_overlap=0,
-        )
-        splits = splitter.split_text(text)
 
-        chain = create_extraction_chain(schema=self.schema, llm=self.llm)
+    def extract_structured(self, response: Response) -> Tuple[Optional[str], List[Dict]]:
+        """
+        Extracts job information without the model, from JSON-LD, microdata or known job board markup.
+
+        Args:
+            response: The response object containing the HTML page.
+
+        Returns:
+            tuple: The name of the extractor that matched and its jobs, or (None, []) when the page needs the model.
+        """
+        name, jobs = extractors.extract(response)
+        return name, [{**job, "token_cost": "0"} for job in jobs]
+
+
+    def extract_text(self, text: str) -> Tuple[List[Dict], int]:
+        """
+        Extracts job information from the cleaned text of a page using the extraction chain.
+
+        Pages that fit into one call skip the splitter and are extracted in
+        the calling thread; a page has at most one token per UTF-8 byte, so
+        short pages need no count to choose the path. Their tokens are counted
+        once, for the rate limiter's reservation and the chunk cache's saved
+        tokens. Longer pages are split and their
+        chunks extracted concurrently. A chunk whose call failed contributes
+        no jobs and is counted, so callers can tell a partial extraction from
+        a page without jobs.
+
+        Args:
+            text (str): The cleaned text content, see `clean`.
+
+        Returns:
+            tuple: The list of extracted jobs, and the number of chunks whose extraction failed.
+        """
+        started = time.perf_counter()
+        size = len(text.encode("utf-8"))
+        tokens = self.count_tokens(text) if size > self.chunk_tokens else None
+        if tokens is None or tokens <= self.chunk_tokens:
+            self._timed("split", started)
+            started = time.perf_counter()
+            combined_results, total_cost, failed = self._extract_split(text, tokens)
+        else:
+            splits = self.split(text)
+            self._timed("split", started)
+            started = time.perf_counter()
+            combined_results = []
+            total_cost = 0.0
+            failed = 0
+            for split_results, cost, split_failed in self.executor.map(self._extract_split, splits):
+                combined_results.extend(split_results)
+                total_cost += cost
+                failed += split_failed
+        self._timed("extract", started)
+
+        return [{**result, "token_cost": str(round(total_cost, 3))} for result in combined_results if result], int(failed)
+
+
+    def split(self, text: str) -> List[str]:
+        """
+        Splits a long page into chunks whose boundaries depend only on their own content.
+
+        The text is cut into blocks at blank lines, such as the listings of a
+        job board. A chunk ends after a block whose hash falls below a
+        threshold proportional to the block's tokens, so chunks average
+        `chunk_tokens` / 2 tokens; it also ends before a block that would take
+        it over `chunk_tokens`. Inserting or removing a block thus changes the
+        chunk around it only, and the unchanged chunks keep their cache keys.
+        Blocks longer than `chunk_tokens` are split by the recursive splitter.
+
+        Args:
+            text (str): The cleaned text content, see `clean`.
 
-        combined_results = []
+        Returns:
+            list: The chunks, in page order.
+        """
+        target = self.chunk_tokens / 2
+        chunks, chunk, size = [], [], 0
+        for block in text.split("\n\n"):
+            tokens = self.count_tokens(block)
+            if tokens > self.chunk_tokens:
+                if chunk:
+                    chunks.append("\n\n".join(chunk))
+                chunks.extend(self.splitter.split_text(block))
+                chunk, size = [], 0
+                continue
+            if chunk and size + tokens > self.chunk_tokens:
+                chunks.append("\n\n".join(chunk))
+                chunk, size = [], 0
+            chunk.append(block)
+            size += tokens + 1  # with the blank line joining the blocks
+            anchor = int.from_bytes(hashlib.blake2b(block.strip().encode("utf-8"), digest_size=8).digest(), "big")
+            if anchor < min(1.0, tokens / target) * 2 ** 64:
+                chunks.append("\n\n".join(chunk))
+                chunk, size = [], 0
+        if chunk:
+            chunks.append("\n\n".join(chunk))
+        return chunks
+
+
+    def _extract_split(self, split: str, tokens: Optional[int] = None) -> Tuple[List[Dict], float, bool]:
+        # `tokens` is the token count of the split, counted when not given
+        if tokens is None:
+            tokens = self.count_tokens(split)
+        if self.cache is not None:
+            key = ChunkCache.key(self.model, self.schema, split)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.saved(tokens)
+                metrics.SKIPS.inc(reason="chunk-cache")
+                return cached, 0.0, False
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(tokens + self.completion_tokens)
         with get_openai_callback() as cb:
-            for split in splits:
-                try:
-                    split_results = chain.run(split)
-                except Exception:
-                    pass
-                else:
-                    combined_results.extend(split_results)
-
-        return [{**result, "token_cost": str(round(cb.total_cost, 3))} for result in combined_results if result]
+            try:
+                with metrics.LLM_CALL.time():
+                    split_results = self.chain.run(split)
+            except Exception:
+                metrics.FAILURES.inc(operation="llm")
+                split_results = None
+        metrics.TOKENS.inc(cb.prompt_tokens, kind="prompt")
+        metrics.TOKENS.inc(cb.completion_tokens, kind="completion")
+        metrics.DOLLARS.inc(cb.total_cost)
+        if split_results is None:
+            return [], cb.total_cost, True
+        if self.cache is not None:
+            self.cache.put(key, split_results)
+        return split_results, cb.total_cost, False
+
+
+    def close(self) -> None:
+        """
+        Shuts down the agent's extraction threads.
+
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=True)
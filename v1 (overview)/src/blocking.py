@@ -0,0 +1,251 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional, Pattern
+from urllib.parse import urlparse
+import re
+import threading
+
+
+# URL extensions of the resource types a profile can block
+EXTENSIONS = {
+    "image": ["png", "jpe?g", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "media": ["mp4", "webm", "ogg", "ogv", "mp3", "wav", "m4a", "mov", "m3u8"],
+    "font": ["woff2?", "ttf", "otf", "eot"],
+    "stylesheet": ["css"],
+}
+
+# Analytics, advertising and session-recording hosts, matched with their subdomains
+TRACKER_HOSTS = [
+    "google-analytics.com", "googletagmanager.com", "googlesyndication.com", "googleadservices.com",
+    "doubleclick.net", "adservice.google.com", "facebook.net", "connect.facebook.net",
+    "hotjar.com", "clarity.ms", "segment.com", "segment.io", "mixpanel.com", "amplitude.com",
+    "fullstory.com", "nr-data.net", "scorecardresearch.com", "quantserve.com", "criteo.com",
+    "taboola.com", "outbrain.com", "adsrvr.org", "amazon-adsystem.com", "bat.bing.com",
+    "snap.licdn.com", "ads.linkedin.com", "analytics.tiktok.com", "hs-analytics.net",
+]
+
+# Providers of embedded players, maps and social widgets, blocked when framed by another site
+EMBED_HOSTS = [
+    "youtube.com", "youtube-nocookie.com", "player.vimeo.com", "maps.google.com",
+    "facebook.com", "platform.twitter.com", "instagram.com", "disqus.com", "tiktok.com",
+]
+
+# Typical transfer size of a blocked request per resource type, in bytes; the
+# aborted requests are never downloaded, so the bytes saved are an estimate
+ESTIMATED_BYTES = {
+    "image": 20_000,
+    "media": 300_000,
+    "font": 30_000,
+    "stylesheet": 15_000,
+    "script": 25_000,
+    "document": 60_000,
+}
+DEFAULT_BYTES = 5_000
+
+
+
+@dataclass(frozen=True)
+class BlockingProfile:
+    """
+    The requests a browser page does not need to load for job extraction.
+
+    Attributes:
+        resource_types: The Playwright resource types to abort, e.g. "image".
+        trackers: Whether to abort requests to TRACKER_HOSTS.
+        third_party_frames: Whether to abort EMBED_HOSTS documents framed by another site.
+    """
+
+    resource_types: FrozenSet[str] = frozenset()
+    trackers: bool = False
+    third_party_frames: bool = False
+
+
+PROFILES = {
+    "none": BlockingProfile(),
+    "images": BlockingProfile(frozenset({"image"})),
+    "lean": BlockingProfile(frozenset({"image", "media", "font"}), trackers=True),
+    "strict": BlockingProfile(frozenset({"image", "media", "font", "stylesheet"}), trackers=True, third_party_frames=True),
+}
+
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def _hosts_pattern(hosts) -> str:
+    return r"^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?(?:" + "|".join(re.escape(host) for host in hosts) + r")(?::\d+)?(?:[/?#]|$)"
+
+
+
+@dataclass
+class PageBlocking:
+    """
+    The requests blocked on one page.
+
+    Attributes:
+        profile: The profile applied to the page's site.
+        requests: The number of blocked requests per resource type.
+    """
+
+    profile: BlockingProfile
+    requests: Counter = field(default_factory=Counter)
+
+
+    @property
+    def blocked(self) -> int:
+        """
+        The number of blocked requests.
+        """
+        return sum(self.requests.values())
+
+
+    @property
+    def bytes_saved(self) -> int:
+        """
+        The estimated number of bytes the blocked requests would have transferred.
+        """
+        return sum(ESTIMATED_BYTES.get(kind, DEFAULT_BYTES) * count for kind, count in self.requests.items())
+
+
+
+class ResourceBlocker:
+    """
+    Aborts the requests of browser pages that job extraction does not need.
+
+    The browser pools route each context's requests matching `pattern` to
+    `handle`, so every page of a context shares one route. The pattern only
+    matches candidate URLs, by extension and host, which keeps the remaining
+    requests (documents, scripts, XHR) from crossing into Python at all; the
+    handler then checks the resource type before aborting. Resources served
+    without a telling extension therefore still load.
+
+    Sites that break under the default profile get a lighter one through
+    `overrides`, keyed by domain and matched with subdomains. Pages registered
+    with `watch` are reported with the requests and estimated bytes saved.
+    """
+
+    def __init__(self, profile: str = "images", overrides: Optional[Dict[str, str]] = None) -> None:
+        """
+        Initializes the blocker.
+
+        Args:
+            profile (str): The name of the default profile, see PROFILES. Defaults to "images".
+            overrides (dict, optional): Profile names per domain, e.g. {"example.com": "none"}. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.profile = PROFILES[profile]
+        self.overrides = {domain.lower(): PROFILES[name] for domain, name in (overrides or {}).items()}
+        self.pattern = self._pattern()
+        self._pages: Dict[object, PageBlocking] = {}
+        self._lock = threading.Lock()
+
+
+    def _pattern(self) -> Optional[Pattern]:
+        # the union of every profile in use; the handler applies the page's own
+        profiles = [self.profile, *self.overrides.values()]
+        types = set().union(*(profile.resource_types for profile in profiles))
+        hosts = []
+        if any(profile.trackers for profile in profiles):
+            hosts += TRACKER_HOSTS
+        if any(profile.third_party_frames for profile in profiles):
+            hosts += EMBED_HOSTS
+        parts = []
+        extensions = [extension for kind in sorted(types) for extension in EXTENSIONS.get(kind, [])]
+        if extensions:
+            parts.append(r"\.(?:" + "|".join(extensions) + r")(?:[?#]|$)")
+        if hosts:
+            parts.append(_hosts_pattern(hosts))
+        return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+
+    def profile_for(self, url: str) -> BlockingProfile:
+        """
+        Returns the profile applied to the pages of a URL's site.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            BlockingProfile: The override of the site's domain, else the default profile.
+        """
+        host = urlparse(url).netloc.lower().split(":")[0]
+        for domain, profile in self.overrides.items():
+            if _host_matches(host, [domain]):
+                return profile
+        return self.profile
+
+
+    def watch(self, page, url: str) -> None:
+        """
+        Applies the profile of a URL's site to a page and starts counting its blocked requests.
+
+        Args:
+            page: The Playwright page, before navigating to the URL.
+            url (str): The URL the page is about to load.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._pages[page] = PageBlocking(self.profile_for(url))
+
+
+    def release(self, page) -> Optional[PageBlocking]:
+        """
+        Stops counting the blocked requests of a page.
+
+        Args:
+            page: The Playwright page passed to `watch`.
+
+        Returns:
+            PageBlocking: The requests blocked on the page, or None if it was not watched.
+        """
+        with self._lock:
+            return self._pages.pop(page, None)
+
+
+    def _blocks(self, request, profile: BlockingProfile, page_url: str) -> bool:
+        kind = request.resource_type
+        if kind in profile.resource_types:
+            return True
+        host = urlparse(request.url).netloc.lower().split(":")[0]
+        if profile.trackers and _host_matches(host, TRACKER_HOSTS):
+            return True
+        if profile.third_party_frames and kind == "document" and request.frame.parent_frame is not None:
+            site = urlparse(page_url).netloc.lower().split(":")[0]
+            return _host_matches(host, EMBED_HOSTS) and not _host_matches(site, [host])
+        return False
+
+
+    def handle(self, route):
+        """
+        Aborts or continues a routed request according to its page's profile.
+
+        Returns the result of `route.abort()` or `route.continue_()`, which the
+        async Playwright API awaits.
+
+        Args:
+            route: The Playwright route of the request.
+
+        Returns:
+            None, or a coroutine with the async API.
+        """
+        request = route.request
+        try:
+            page = request.frame.page
+        except Exception:
+            # service worker requests have no frame
+            return route.continue_()
+        with self._lock:
+            watched = self._pages.get(page)
+        profile = watched.profile if watched is not None else self.profile
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            return route.continue_()
+        if not self._blocks(request, profile, page.url):
+            return route.continue_()
+        if watched is not None:
+            with self._lock:
+                watched.requests[request.resource_type] += 1
+        return route.abort("blockedbyclient")
@@ -0,0 +1,411 @@
+from playwright.sync_api import sync_playwright, Browser, Page, Error
+from playwright.async_api import async_playwright
+from playwright.async_api import Browser as AsyncBrowser, Page as AsyncPage
+from contextlib import contextmanager, asynccontextmanager
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Coroutine, Deque, Iterator, List
+import asyncio
+import threading
+
+from src.blocking import ResourceBlocker
+from src import metrics
+from src.logger import logger
+
+
+
+class PooledBrowser:
+    """
+    A warm Firefox process together with the context its pages are opened in.
+
+    Attributes:
+        browser: The Playwright browser object.
+        context: The browser context shared by the pages of this browser.
+        pages: The number of pages served since the browser was launched.
+        crashed: Whether the browser reported a disconnect.
+    """
+
+    def __init__(self, browser: Browser, blocker: ResourceBlocker = None) -> None:
+        """
+        Wraps a freshly launched browser.
+
+        Args:
+            browser: The Playwright browser object.
+            blocker: The resource blocker to route the context's requests through. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.browser = browser
+        self.context = browser.new_context()
+        if blocker is not None and blocker.pattern is not None:
+            self.context.route(blocker.pattern, blocker.handle)
+        self.pages = 0
+        self.crashed = False
+        browser.on("disconnected", self._on_disconnect)
+
+
+    def _on_disconnect(self, *_) -> None:
+        self.crashed = True
+
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the browser process is still usable.
+        """
+        return not self.crashed and self.browser.is_connected()
+
+
+    def close(self) -> None:
+        """
+        Closes the context and the browser process.
+
+        Returns:
+            None
+        """
+        try:
+            self.context.close()
+            self.browser.close()
+        except Exception:
+            pass
+
+
+
+class BrowserPool:
+    """
+    A long-lived pool of warm browser processes.
+
+    Browsers are launched lazily on first use and then reused for every page,
+    across crawls. A browser is recycled after serving `max_pages` pages, and a
+    browser that crashed is replaced transparently on its next checkout.
+
+    The pool drives the sync Playwright API, so it must be used from the thread
+    that first called `page()`.
+    """
+
+    def __init__(self, size: int = 1, headless: bool = True, max_pages: int = 50, blocker: ResourceBlocker = None) -> None:
+        """
+        Initializes the pool without launching anything.
+
+        Args:
+            size (int): The number of browser processes to keep warm. Defaults to 1.
+            headless (bool): Whether to run the browsers in headless mode. Defaults to True.
+            max_pages (int): The number of pages a browser serves before it is recycled. Defaults to 50.
+            blocker (ResourceBlocker, optional): The requests to block in every page. Defaults to blocking images.
+
+        Returns:
+            None
+        """
+        self.size = size
+        self.headless = headless
+        self.max_pages = max_pages
+        self.blocker = blocker or ResourceBlocker()
+        self._playwright = None
+        self._idle: Deque[PooledBrowser] = deque()
+
+
+    def start(self) -> None:
+        """
+        Starts Playwright and launches the pool's browsers.
+
+        Returns:
+            None
+        """
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        while len(self._idle) < self.size:
+            self._idle.append(self._launch())
+
+
+    def _launch(self) -> PooledBrowser:
+        logger.info("Launching browser")
+        with metrics.BROWSER_LAUNCH.time():
+            return PooledBrowser(self._playwright.firefox.launch(headless=self.headless), self.blocker)
+
+
+    def _checkout(self) -> PooledBrowser:
+        self.start()
+        slot = self._idle.popleft()
+        if not slot.alive:
+            logger.info("Replacing crashed browser")
+            slot.close()
+            slot = self._launch()
+        elif slot.pages >= self.max_pages:
+            logger.info(f"Recycling browser after {slot.pages} pages")
+            slot.close()
+            slot = self._launch()
+        return slot
+
+
+    @contextmanager
+    def page(self) -> Iterator[Page]:
+        """
+        Opens a new page in one of the pool's browsers and closes it afterwards.
+
+        Yields:
+            Page: The Playwright page object.
+        """
+        slot = self._checkout()
+        try:
+            page = slot.context.new_page()
+            try:
+                yield page
+            finally:
+                slot.pages += 1
+                try:
+                    page.close()
+                except Error:
+                    pass
+        finally:
+            self._idle.append(slot)
+
+
+    def close(self) -> None:
+        """
+        Closes every browser in the pool and stops Playwright.
+
+        Returns:
+            None
+        """
+        while self._idle:
+            self._idle.popleft().close()
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+
+
+class AsyncPooledBrowser:
+    """
+    A warm Firefox process driven by the async Playwright API.
+
+    Unlike PooledBrowser, several pages may be open in it at the same time.
+
+    Attributes:
+        browser: The Playwright browser object.
+        context: The browser context shared by the pages of this browser.
+        pages: The number of pages handed out since the browser was launched.
+        active: The number of pages currently open.
+        crashed: Whether the browser reported a disconnect.
+        retired: Whether the browser was taken out of rotation and waits for its pages to close.
+    """
+
+    def __init__(self, browser: AsyncBrowser) -> None:
+        """
+        Wraps a freshly launched browser; its context is opened by the pool.
+
+        Args:
+            browser: The async Playwright browser object.
+
+        Returns:
+            None
+        """
+        self.browser = browser
+        self.context = None
+        self.pages = 0
+        self.active = 0
+        self.crashed = False
+        self.retired = False
+        browser.on("disconnected", self._on_disconnect)
+
+
+    def _on_disconnect(self, *_) -> None:
+        self.crashed = True
+
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the browser process is still usable.
+        """
+        return not self.crashed and self.browser.is_connected()
+
+
+    async def close(self) -> None:
+        """
+        Closes the context and the browser process.
+
+        Returns:
+            None
+        """
+        try:
+            if self.context is not None:
+                await self.context.close()
+            await self.browser.close()
+        except Exception:
+            pass
+
+
+
+class AsyncBrowserPool:
+    """
+    A long-lived pool of warm browser processes for concurrent crawling.
+
+    The pool runs its own event loop in a background thread, so it can be shared
+    by synchronous callers across crawls; coroutines that use `page()` are
+    handed to that loop with `submit()`. Pages are spread over the least busy
+    browsers. A browser that served `max_pages` pages is retired and closed once
+    its open pages finish, and a crashed browser is replaced on the next checkout.
+    """
+
+    def __init__(self, size: int = 1, headless: bool = True, max_pages: int = 50, blocker: ResourceBlocker = None) -> None:
+        """
+        Initializes the pool without launching anything.
+
+        Args:
+            size (int): The number of browser processes to keep warm. Defaults to 1.
+            headless (bool): Whether to run the browsers in headless mode. Defaults to True.
+            max_pages (int): The number of pages a browser serves before it is recycled. Defaults to 50.
+            blocker (ResourceBlocker, optional): The requests to block in every page. Defaults to blocking images.
+
+        Returns:
+            None
+        """
+        self.size = size
+        self.headless = headless
+        self.max_pages = max_pages
+        self.blocker = blocker or ResourceBlocker()
+        self._playwright = None
+        self._browsers: List[AsyncPooledBrowser] = []
+        self._retired: List[AsyncPooledBrowser] = []
+        self._lock = None
+        self._loop = None
+        self._thread = None
+        self._starting = threading.Lock()
+
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the pool's event loop has been started.
+        """
+        return self._loop is not None
+
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Schedules a coroutine on the pool's event loop, starting the loop if needed.
+
+        Safe to call from several threads, e.g. the schedulers of both stages.
+
+        Args:
+            coro: The coroutine to run.
+
+        Returns:
+            Future: A future holding the result of the coroutine.
+        """
+        with self._starting:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+                self._thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+    async def start(self) -> None:
+        """
+        Starts Playwright and launches the pool's browsers.
+
+        Returns:
+            None
+        """
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        while len(self._browsers) < self.size:
+            self._browsers.append(await self._launch())
+
+
+    async def _launch(self) -> AsyncPooledBrowser:
+        logger.info("Launching browser")
+        with metrics.BROWSER_LAUNCH.time():
+            slot = AsyncPooledBrowser(await self._playwright.firefox.launch(headless=self.headless))
+            slot.context = await slot.browser.new_context()
+            if self.blocker.pattern is not None:
+                await slot.context.route(self.blocker.pattern, self.blocker.handle)
+        return slot
+
+
+    async def _checkout(self) -> AsyncPooledBrowser:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self.start()
+            for i, slot in enumerate(self._browsers):
+                if not slot.alive:
+                    logger.info("Replacing crashed browser")
+                    self._browsers[i] = await self._launch()
+                    await slot.close()
+                elif slot.pages >= self.max_pages:
+                    logger.info(f"Recycling browser after {slot.pages} pages")
+                    slot.retired = True
+                    self._browsers[i] = await self._launch()
+                    if slot.active == 0:
+                        await slot.close()
+                    else:
+                        self._retired.append(slot)
+            slot = min(self._browsers, key=lambda item: item.active)
+            slot.active += 1
+            slot.pages += 1
+            return slot
+
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[AsyncPage]:
+        """
+        Opens a new page in the least busy browser and closes it afterwards.
+
+        Yields:
+            Page: The async Playwright page object.
+        """
+        slot = await self._checkout()
+        try:
+            page = await slot.context.new_page()
+            try:
+                yield page
+            finally:
+                try:
+                    await page.close()
+                except Error:
+                    pass
+        finally:
+            slot.active -= 1
+            if slot.retired and slot.active == 0 and slot in self._retired:
+                self._retired.remove(slot)
+                await slot.close()
+
+
+    async def _close(self) -> None:
+        # retired browsers still serving pages are closed as well
+        for slot in self._browsers + self._retired:
+            await slot.close()
+        self._browsers = []
+        self._retired = []
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+
+    def close(self) -> None:
+        """
+        Closes every browser in the pool and stops its event loop.
+
+        Returns:
+            None
+        """
+        if self._loop is None:
+            return
+        self.submit(self._close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+        self._lock = None
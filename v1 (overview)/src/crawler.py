@@ -1,7 +1,17 @@
 from tenacity import wait_exponential, retry, stop_after_attempt
-from playwright.sync_api import sync_playwright
 from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from src.browser import BrowserPool, AsyncBrowserPool
+from src.blocking import PageBlocking
+from src.pagination import Paginator, PaginationResult
+from src.readiness import wait_until_ready, wait_until_ready_async
+from src.politeness import HostLimiter
+from src.fetcher import HttpFetcher, HttpReply, looks_rendered
+from src.cache import ResponseCache
 from src.db import DB
+from src import metrics
+from urllib.parse import urlparse
+import asyncio
 
 from src.logger import logger
 
@@ -11,29 +21,145 @@ class Response:
     status_code: int
     text: str
     url: str
+    ready_time: float = None
+    tier: str = "browser"
+    etag: str = None
+    last_modified: str = None
+    not_modified: bool = False
+    blocked_requests: int = 0
+    blocked_bytes: int = 0
+    pagination: PaginationResult = None
 
 # t@VPQ595ycQ_#wL
 
 class Crawler:
 
-    def __init__(self, mysql: DB, headless: bool = True, timeout: int = 20):
+    def __init__(self, mysql: DB, headless: bool = True, timeout: int = 20, quiet_window: int = 500, pool: BrowserPool = None, async_pool: AsyncBrowserPool = None, pool_size: int = 1, max_pages_per_browser: int = 50, http: HttpFetcher = None, responses: ResponseCache = None, limiter: HostLimiter = None, paginator: Paginator = None, stage: str = "overview", reprobe_days: int = 7):
             """
             Initializes the Crawler object.
 
             Args:
                 mysql (DB): The MySQL database object.
                 headless (bool, optional): Whether to run the browser in headless mode. Defaults to True.
-                timeout (int, optional): The timeout value in seconds. Defaults to 10.
+                timeout (int, optional): The timeout value in seconds, also the ceiling for the readiness wait. Defaults to 10.
+                quiet_window (int, optional): The milliseconds without DOM or height changes after which a page counts as ready. Defaults to 500.
+                pool (BrowserPool, optional): A shared browser pool to fetch pages with. Defaults to a pool owned by this crawler.
+                async_pool (AsyncBrowserPool, optional): A shared browser pool for concurrent crawls. Defaults to a pool owned by this crawler.
+                pool_size (int, optional): The number of warm browsers when the crawler owns its pool. Defaults to 1.
+                max_pages_per_browser (int, optional): The number of pages a browser serves before it is recycled. Defaults to 50.
+                http (HttpFetcher, optional): A shared plain HTTP fetcher, tried before the browser. Defaults to one owned by this crawler.
+                responses (ResponseCache, optional): A cache of page bodies and validators for conditional requests. Defaults to None (no caching).
+                limiter (HostLimiter, optional): Politeness limits shared with other crawlers on the same async pool. Defaults to new limits per crawl.
+                paginator (Paginator, optional): Loads the further jobs of infinite-scroll, "load more" and paged boards before the content is read. Defaults to None (no pagination).
+                stage (str, optional): The crawl stage the learned fetch tiers belong to. Defaults to "overview".
+                reprobe_days (int, optional): The days after which a host learned to need the browser is tried over plain HTTP again. Defaults to 7.
             """
             self.mysql = mysql
             self.timeout = timeout * 1000
             self.headless = headless
+            self.quiet_window = quiet_window
+            self.ready_times: List[float] = []
+            self.blocked_requests = 0
+            self.blocked_bytes = 0
+            self.failed = 0
+            self.pool = pool or BrowserPool(size=pool_size, headless=headless, max_pages=max_pages_per_browser)
+            self.async_pool = async_pool or AsyncBrowserPool(size=pool_size, headless=headless, max_pages=max_pages_per_browser)
+            self.http = http or HttpFetcher(timeout=timeout)
+            self.responses = responses
+            self.limiter = limiter
+            self.paginator = paginator
+            self.stage = stage
+            self.reprobe_days = reprobe_days
+            self.tiers: Dict[str, str] = {}
+            self.learned: Dict[str, str] = {}
+
+
+    def _learn(self, url: str, tier: str) -> None:
+            host = urlparse(url).netloc.lower()
+            if self.tiers.get(host) != tier:
+                self.tiers[host] = tier
+                self.learned[host] = tier
+
+
+    def _cached(self, url: str) -> Tuple[Optional[Dict], Dict]:
+            cached = self.responses.get(url) if self.responses is not None else None
+            if cached is None:
+                return None, {}
+            return cached, {"etag": cached.get("etag"), "last_modified": cached.get("last_modified")}
+
+
+    def _from_http(self, url: str, cached: Optional[Dict], reply: Optional[HttpReply]) -> Optional[Response]:
+            # a 304 reuses the cached HTTP page; a rendered 200 is used as is and
+            # teaches the host's tier. Only a 200 page that is not rendered teaches
+            # that the host needs the browser; failed requests, error statuses and
+            # other content types fall back to the browser for this page only
+            if reply is not None and reply.status_code == 304 and cached is not None:
+                self.responses.revalidated()
+                return Response(status_code=200, text=cached["body"], url=url, tier="http", not_modified=True)
+            if reply is not None and reply.status_code == 200 and looks_rendered(reply.text):
+                self._learn(url, "http")
+                self._store(url, reply.text, reply.etag, reply.last_modified)
+                return Response(status_code=200, text=reply.text, url=url, tier="http", etag=reply.etag, last_modified=reply.last_modified)
+            if reply is not None and reply.status_code == 200:
+                self._learn(url, "browser")
+            return None
+
+
+    def _store(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+            if self.responses is not None:
+                self.responses.store(url, body, etag, last_modified)
 
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3))
     def fetch(self, url: str) -> Response:
             """
-            Fetches the content of a web page.
+            Fetches a web page over plain HTTP when that is enough, else with the browser.
+
+            Pages with cached validators are requested conditionally, and a 304
+            answer returns the cached page flagged as `not_modified`. The HTTP
+            result is used if it already looks rendered; otherwise the page is
+            fetched again with the browser. The decision is remembered per host
+            and stage, so hosts known to need a browser skip the HTTP attempt
+            until they are probed again after `reprobe_days`. Browser pages
+            are always rendered again and never cached: their document often
+            stays the same while the jobs arrive over XHR, so its validators say
+            nothing about the jobs.
+
+            Args:
+                url (str): The URL of the web page to fetch.
+
+            Returns:
+                Response: The response object containing the fetched content.
+            """
+            if self.tiers.get(urlparse(url).netloc.lower()) != "browser":
+                cached, validators = self._cached(url)
+                response = self._from_http(url, cached, self.http.fetch(url, **validators))
+                if response is not None:
+                    return response
+            return self.fetch_browser(url)
+
+
+    async def fetch_async(self, url: str) -> Response:
+            """
+            Async counterpart of `fetch`.
+
+            Args:
+                url (str): The URL of the web page to fetch.
+
+            Returns:
+                Response: The response object containing the fetched content.
+            """
+            if self.tiers.get(urlparse(url).netloc.lower()) != "browser":
+                cached, validators = self._cached(url)
+                response = self._from_http(url, cached, await self.http.fetch_async(url, **validators))
+                if response is not None:
+                    return response
+            return await self.fetch_browser_async(url)
+
+
+    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3), before_sleep=lambda state: metrics.RETRIES.inc(operation="browser"))
+    def fetch_browser(self, url: str) -> Response:
+            """
+            Fetches the content of a web page with the browser.
 
             Args:
                 url (str): The URL of the web page to fetch.
@@ -45,43 +171,230 @@ class Crawler:
                 Exception: If an error occurs during the fetching process.
             """
             try:
-                with sync_playwright() as play:
-                    browser = play.firefox.launch(headless=self.headless)
-                    page = browser.new_page()
-                    page.route("**/*", lambda route: route.abort() if route.request.resource_type == "image" else route.continue_())
-                    page.goto(url, timeout=self.timeout)
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    page.wait_for_timeout(self.timeout)
-                    content = page.content()
-                    page.close()
-                return Response(status_code=200, text=content, url=url)
+                with self.pool.page() as page:
+                    self.pool.blocker.watch(page, url)
+                    try:
+                        with metrics.NAVIGATION.time():
+                            page.goto(url, timeout=self.timeout)
+                        ready_time = wait_until_ready(page, ceiling=self.timeout, quiet=self.quiet_window)
+                        pagination = self.paginator.run(page) if self.paginator is not None else None
+                        content = page.content()
+                    finally:
+                        blocked = self.pool.blocker.release(page)
+                self.ready_times.append(ready_time)
+                return self._rendered(url, content, ready_time, blocked, pagination)
             except Exception as e:
                 raise e
 
 
-    def crawl(self, urls):
+    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3), before_sleep=lambda state: metrics.RETRIES.inc(operation="browser"))
+    async def fetch_browser_async(self, url: str) -> Response:
+            """
+            Fetches the content of a web page with the browser, using the async Playwright API.
+
+            Args:
+                url (str): The URL of the web page to fetch.
+
+            Returns:
+                Response: The response object containing the fetched content.
+            """
+            async with self.async_pool.page() as page:
+                self.async_pool.blocker.watch(page, url)
+                try:
+                    with metrics.NAVIGATION.time():
+                        await page.goto(url, timeout=self.timeout)
+                    ready_time = await wait_until_ready_async(page, ceiling=self.timeout, quiet=self.quiet_window)
+                    pagination = await self.paginator.run_async(page) if self.paginator is not None else None
+                    content = await page.content()
+                finally:
+                    blocked = self.async_pool.blocker.release(page)
+            self.ready_times.append(ready_time)
+            return self._rendered(url, content, ready_time, blocked, pagination)
+
+
+    def _rendered(self, url: str, content: str, ready_time: float, blocked: Optional[PageBlocking], pagination: Optional[PaginationResult]) -> Response:
+            # the browser response, with the requests its blocking profile saved and its pagination
+            requests = blocked.blocked if blocked is not None else 0
+            saved = blocked.bytes_saved if blocked is not None else 0
+            self.blocked_requests += requests
+            self.blocked_bytes += saved
+            metrics.READINESS.observe(ready_time)
+            return Response(status_code=200, text=content, url=url, ready_time=ready_time, blocked_requests=requests, blocked_bytes=saved, pagination=pagination)
+
+
+    async def _fetch_limited(self, limiter: HostLimiter, client_id: int, url: str):
+            async with limiter.slot(url):
+                logger.info(f"Processing: {url}")
+                try:
+                    response = await self.fetch_async(url)
+                    self._log_fetch(response)
+                    return client_id, response
+                except Exception as e:
+                    self.failed += 1
+                    metrics.FAILURES.inc(operation="fetch")
+                    logger.error(f"Failed: {url} ({e!r})")
+
+
+    async def crawl_async(self, pages: List[Tuple[int, str]], concurrency: int = 8, per_host: int = 2, min_delay: float = 1.0) -> AsyncIterator[Tuple[int, Response]]:
+            """
+            Fetches the given pages concurrently and yields them as they complete.
+
+            Must run on the event loop of the crawler's async pool. Pages that
+            still fail after retries are logged and left out. A shared limiter
+            given to the crawler takes the place of the politeness arguments.
+            At most twice `concurrency` pages are fetched or wait for the caller
+            at a time, so a slow caller holds back the crawl instead of letting
+            responses pile up.
+
+            Args:
+                pages (list): The (client_id, url) pairs to fetch, see `DB.claim_queue`.
+                concurrency (int, optional): The maximum number of pages in flight. Defaults to 8.
+                per_host (int, optional): The maximum number of pages in flight per host. Defaults to 2.
+                min_delay (float, optional): The minimum seconds between two fetches to the same host. Defaults to 1.0.
+
+            Yields:
+                tuple: The client id and the response for each crawled page, in completion order.
+            """
+            limiter = self.limiter or HostLimiter(concurrency=concurrency, per_host=per_host, min_delay=min_delay)
+            waiting = iter(pages)
+            tasks = set()
+            try:
+                while True:
+                    for client_id, url in waiting:
+                        tasks.add(asyncio.ensure_future(self._fetch_limited(limiter, client_id, url)))
+                        if len(tasks) >= 2 * concurrency:
+                            break
+                    if not tasks:
+                        break
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        result = task.result()
+                        if result is not None:
+                            yield result
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+    def fetch_concurrent(self, pages: List[Tuple[int, str]], concurrency: int = 8, per_host: int = 2, min_delay: float = 1.0):
             """
-            Crawls the given list of URLs and yields the response for each URL.
+            Fetches pages that are known to be due concurrently and yields the responses in completion order.
+
+            The responses are handed over through a queue of `concurrency`
+            entries, which holds back the crawl while the caller is busy.
 
             Args:
-                urls (list): A list of URLs to crawl.
+                pages (list): The (client_id, url) pairs to fetch, see `DB.claim_queue`.
+                concurrency (int, optional): The maximum number of pages in flight. Defaults to 8.
+                per_host (int, optional): The maximum number of pages in flight per host. Defaults to 2.
+                min_delay (float, optional): The minimum seconds between two fetches to the same host. Defaults to 1.0.
 
             Yields:
-                Response: The response object for each crawled URL.
+                tuple: The client id and the response for each crawled page.
+            """
+            if not pages:
+                return
+
+            self.ready_times = []
+            self.blocked_requests = 0
+            self.blocked_bytes = 0
+            self.failed = 0
+            self.tiers = self.mysql.get_fetch_tiers(self.stage, reprobe_days=self.reprobe_days)
+
+            async def bounded_queue():
+                # created on the pool's event loop, which it is bound to
+                return asyncio.Queue(maxsize=concurrency)
+
+            async def pump(results):
+                error = None
+                try:
+                    async for item in self.crawl_async(pages, concurrency, per_host, min_delay):
+                        await results.put(item)
+                except Exception as e:
+                    error = e
+                # no end marker when cancelled, the caller is gone
+                await results.put(None)
+                if error is not None:
+                    raise error
+
+            results = self.async_pool.submit(bounded_queue()).result()
+            future = self.async_pool.submit(pump(results))
+            try:
+                while (item := self.async_pool.submit(results.get()).result()) is not None:
+                    yield item
+            except BaseException:
+                future.cancel()
+                raise
+            future.result()
+            self.save_tiers()
+            self.log_readiness()
+
+
+    def _log_fetch(self, response: Response) -> None:
+            if response.not_modified:
+                logger.info(f"Not modified: {response.url}")
+            elif response.tier == "browser":
+                logger.info(f"Ready in {response.ready_time:.1f}s, {response.blocked_requests} requests (~{response.blocked_bytes // 1024} KB) blocked: {response.url}")
+                pagination = response.pagination
+                if pagination is not None and pagination.steps:
+                    actions = ", ".join(f"{action} {count}" for action, count in pagination.actions.most_common())
+                    logger.info(f"Paginated in {pagination.seconds:.1f}s ({actions}), {pagination.items[0]} -> {pagination.items[1]} items, stopped on {pagination.stop}: {response.url}")
+            else:
+                logger.info(f"Fetched over {response.tier}: {response.url}")
+
+
+    def save_tiers(self) -> None:
+            """
+            Persists the fetch tiers learned for new or changed hosts.
+
+            Returns:
+                None
+            """
+            if self.learned:
+                self.mysql.save_fetch_tiers(self.learned, self.stage)
+                self.learned = {}
+
+
+    def readiness_summary(self) -> Dict:
             """
-            for url in urls:
-                client_id, value = list(url.items())[0]
-                if value is None:
-                     continue
-                exists_or_expired = self.mysql.lookup(value, table="overview")
-                if not exists_or_expired:
-                    logger.info(f"Processing: {value}")
-                    response = self.fetch(value)
-                    yield client_id, response
-                else:
-                    logger.info(f"Skipped (already exists): {value}")
+            Summarizes the time-to-ready of the pages fetched so far.
 
+            Returns:
+                dict: The page count, total and average seconds to ready, the seconds saved against waiting the full timeout, and the requests and estimated bytes blocked.
+            """
+            pages = len(self.ready_times)
+            total = sum(self.ready_times)
+            return {
+                "pages": pages,
+                "ready_seconds": round(total, 1),
+                "average_ready_seconds": round(total / pages, 2) if pages else 0.0,
+                "saved_seconds": round(pages * self.timeout / 1000 - total, 1),
+                "blocked_requests": self.blocked_requests,
+                "blocked_bytes": self.blocked_bytes,
+            }
+
+
+    def log_readiness(self) -> None:
+            """
+            Logs the readiness summary of the crawl.
 
+            Returns:
+                None
+            """
+            summary = self.readiness_summary()
+            if summary["pages"]:
+                logger.info(f"Readiness: {summary['pages']} pages, {summary['average_ready_seconds']}s average, {summary['saved_seconds']}s saved, {summary['blocked_requests']} requests (~{summary['blocked_bytes'] // (1024 * 1024)} MB) blocked")
 
 
+    def close(self) -> None:
+            """
+            Closes the browsers of the crawler's pools and its HTTP clients.
 
+            Returns:
+                None
+            """
+            self.http.close()
+            if self.async_pool.running:
+                self.async_pool.submit(self.http.close_async()).result()
+            self.pool.close()
+            self.async_pool.close()
@@ -1,6 +1,215 @@
 import pymysql.cursors
-from typing import List, Tuple
-import datetime
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+import functools
+import threading
+import json
+import time
+
+from src import metrics
+from src.logger import logger
+from src.recrawl import RecrawlPolicy
+from src import schema
+
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of MySQL connections.
+
+    Keeps at least `min_size` connections open and hands out at most `max_size`
+    at a time; callers beyond that wait for a connection to be returned.
+    Connections that sat idle for longer than `ping_after` seconds are pinged
+    on checkout and reopened if the server dropped them, and connections that
+    failed while checked out are discarded instead of returned.
+    """
+
+    def __init__(self, connect: Callable[[], pymysql.connections.Connection], min_size: int = 1, max_size: int = 4, ping_after: float = 30.0) -> None:
+        """
+        Initializes the pool and opens its first `min_size` connections.
+
+        Args:
+            connect: Opens a new connection.
+            min_size (int): The number of connections kept open. Defaults to 1.
+            max_size (int): The maximum number of open connections. Defaults to 4.
+            ping_after (float): The idle seconds after which a connection is checked before use. Defaults to 30.0.
+
+        Returns:
+            None
+        """
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.ping_after = ping_after
+        self.opened = 0
+        self.reconnects = 0
+        self._idle: Deque[Tuple[pymysql.connections.Connection, float]] = deque()
+        self._size = 0
+        self._available = threading.Condition()
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._open(), time.monotonic()))
+
+
+    def _open(self) -> pymysql.connections.Connection:
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+        self.opened += 1
+        return connection
+
+
+    def _healthy(self, connection: pymysql.connections.Connection, idle_since: float) -> bool:
+        if not connection.open:
+            return False
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except pymysql.err.Error:
+            return False
+
+
+    def checkout(self) -> pymysql.connections.Connection:
+        """
+        Takes a healthy connection from the pool, opening one if none is idle.
+
+        Returns:
+            The connection, to be given back with `release`.
+        """
+        with self._available:
+            while not self._idle and self._size >= self.max_size:
+                self._available.wait()
+            if not self._idle:
+                self._size += 1
+                return self._open()
+            connection, idle_since = self._idle.pop()
+        if self._healthy(connection, idle_since):
+            return connection
+        logger.info("Reopening stale database connection")
+        self.reconnects += 1
+        self._discard(connection)
+        with self._available:
+            self._size += 1
+        return self._open()
+
+
+    def release(self, connection: pymysql.connections.Connection) -> None:
+        """
+        Returns a connection to the pool, or discards it if it is broken.
+
+        Args:
+            connection: The connection from `checkout`.
+
+        Returns:
+            None
+        """
+        if not connection.open:
+            self._discard(connection)
+            return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+
+    def _discard(self, connection: pymysql.connections.Connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._available:
+            self._size -= 1
+            self._available.notify()
+
+
+    @contextmanager
+    def connection(self, broken: Tuple = (pymysql.err.OperationalError, pymysql.err.InterfaceError)) -> Iterator[pymysql.connections.Connection]:
+        """
+        Checks out a connection for the duration of a `with` block.
+
+        Args:
+            broken (tuple): The exceptions after which the connection is discarded. Defaults to connection errors.
+
+        Yields:
+            The connection.
+        """
+        connection = self.checkout()
+        try:
+            yield connection
+        except broken:
+            self._discard(connection)
+            raise
+        except BaseException:
+            try:
+                connection.rollback()
+            except pymysql.err.Error:
+                pass
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the pool counters.
+
+        Returns:
+            dict: The open and idle connections, the connections opened so far and the stale ones reopened.
+        """
+        with self._available:
+            return {"size": self._size, "idle": len(self._idle), "opened": self.opened, "reconnects": self.reconnects}
+
+
+    def close(self) -> None:
+        """
+        Closes the idle connections.
+
+        Returns:
+            None
+        """
+        with self._available:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+
+def pooled(method):
+    """
+    Runs a DB method on a connection checked out from the pool.
+
+    Nested calls on the same thread share the connection. If the connection
+    drops (OperationalError), the method is retried once on a fresh one.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._local, "connection", None) is not None:
+            return method(self, *args, **kwargs)
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as connection:
+                    self._local.connection = connection
+                    try:
+                        return method(self, *args, **kwargs)
+                    finally:
+                        self._local.connection = None
+            except pymysql.err.OperationalError as e:
+                if attempt:
+                    raise
+                metrics.RETRIES.inc(operation="db")
+                logger.info(f"Database connection lost in {method.__name__}, retrying: {e!r}")
+    return wrapper
 
 
 
@@ -9,187 +218,741 @@ class DB:
     A class representing a database connection and operations.
 
     Attributes:
-        connection: The database connection object.
-        cursor: The database cursor object.
+        pool: The pool of database connections.
+        connection: The connection checked out by the current thread.
+        cursor: A cursor on that connection.
 
     Methods:
-        __init__: Initializes the DB object and establishes a database connection.
-        get_urls: Placeholder method for retrieving URLs from the database.
-        insert: Inserts data into the specified table in the database.
-        close_connection: Closes the database connection.
+        __init__: Initializes the DB object and opens the connection pool.
+        migrate: Creates or upgrades the tables and indexes.
+        write_batch: Replaces the jobs of many sources and stores their fingerprints in one transaction.
+        claim_queue: Claims a batch of due pages of a crawl queue.
+        queue_stats: Measures the backlog of a crawl queue.
+        sync_url_schedule: Schedules the websites added to the urls table.
+        get_fingerprint: Retrieves the fingerprint and jobs stored for a page.
+        get_fetch_tiers: Retrieves the fetch tier learned for each host.
+        close_connection: Closes the pooled database connections.
         __del__: Destructor method that closes the database connection.
 
     """
 
-    def __init__(self, server: str, user: str, password: str, db: str, max_age: int = 2) -> None:
+    def __init__(self, server: str, user: str, password: str, db: str, max_age: int = 2, min_connections: int = 1, max_connections: int = 4, recrawl: RecrawlPolicy = None) -> None:
         """
-        Initializes the DB object and establishes a database connection.
+        Initializes the DB object and its pool of database connections.
 
         Args:
             server: The server address of the database.
             user: The username for the database connection.
             password: The password for the database connection.
             db: The name of the database.
+            max_age: The number of days a scraped source stays fresh.
+            min_connections: The number of connections kept open.
+            max_connections: The maximum number of connections in use at once.
+            recrawl: How the recrawl interval of queued pages adapts to their changes.
 
         Returns:
             None
 
         """
-        self.connection = pymysql.connect(
-            host=server,
-            user=user,
-            password=password,
-            database=db,
-            cursorclass=pymysql.cursors.DictCursor
+        self.pool = ConnectionPool(
+            lambda: pymysql.connect(
+                host=server,
+                user=user,
+                password=password,
+                database=db,
+                cursorclass=pymysql.cursors.DictCursor
+            ),
+            min_size=min_connections,
+            max_size=max_connections,
         )
-        self.cursor = self.connection.cursor()
         self.max_age = max_age
+        self.recrawl = recrawl or RecrawlPolicy()
+        self._local = threading.local()
 
 
-    def get_urls(self, table: str) -> List:
+    @property
+    def connection(self) -> pymysql.connections.Connection:
+        """
+        The connection checked out by the current thread, see `pooled`.
         """
-        retrieving URLs from the database.
+        return self._local.connection
+
+
+    @property
+    def cursor(self) -> pymysql.cursors.DictCursor:
+        """
+        A cursor on the current thread's connection.
+        """
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or cursor.connection is not self._local.connection:
+            cursor = self._local.cursor = self._local.connection.cursor()
+        return cursor
+
+
+    @pooled
+    def write_batch(self, sources: Dict[Tuple[str, str], List[Tuple]], fingerprints: Dict[Tuple[str, str], Tuple[str, List[Dict]]] = None, batch_size: int = 200, feed_queue: bool = False, drain_queue: Optional[str] = None) -> Dict[str, int]:
+        """
+        Replaces the jobs of many sources and stores their fingerprints in a single transaction.
+
+        The new jobs of a source are diffed against the stored ones, keyed by
+        job_page_url and title: new jobs are inserted, jobs whose client or
+        description changed are updated, vanished jobs are deleted, and the
+        scraping times of all remaining jobs are bumped. Readers never see a
+        source empty.
+
+        Args:
+            sources: Tuples of (client_id, title, description, token_cost, scraping_start_time, scraping_end_time, job_page_url, source) of each (table, source).
+            fingerprints: The fingerprint and extracted jobs of each (table, source), see `get_fingerprint`.
+            batch_size: The number of rows per multi-row INSERT.
+            feed_queue: Whether to queue the job pages of the new and changed jobs and drop those of removed jobs, see `enqueue` and `dequeue`.
+            drain_queue: The crawl queue in which to mark the sources as crawled, see `complete`.
+
+        Returns:
+            The number of rows inserted, updated, deleted and left unchanged.
+
+        """
+        tables = defaultdict(dict)
+        for (table, source), data in sources.items():
+            tables[table][source] = data
+        counts = Counter(inserted=0, updated=0, deleted=0, unchanged=0)
+        modified = set()
+        try:
+            for table, data in tables.items():
+                written, new, changed, touched, vanished = self._replace_rows(table, data, batch_size)
+                counts.update(written)
+                modified |= touched
+                if feed_queue:
+                    self.enqueue(new, changed=False)
+                    self.enqueue(changed, changed=True)
+                    self.dequeue(vanished, table=table)
+            if fingerprints:
+                modified |= self._changed_fingerprints(fingerprints)
+                query = """
+                    INSERT INTO fingerprints (table_name, source_hash, source, fingerprint, jobs)
+                    VALUES (%s, SHA2(%s, 256), %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE fingerprint = VALUES(fingerprint), jobs = VALUES(jobs);
+                """
+                self.cursor.executemany(query, [(table, source, source, fingerprint, json.dumps(jobs)) for (table, source), (fingerprint, jobs) in fingerprints.items()])
+            if drain_queue:
+                self.complete([source for _, source in sources], queue=drain_queue, changed=modified)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return dict(counts)
+
+
+    def enqueue(self, data: List[Tuple], changed: bool) -> None:
+        """
+        Queues the job pages of overview records for the individual stage; the caller commits.
+
+        A job page listed by several clients is queued once. A new job page is
+        due right away; a known one only becomes due again when `changed`.
+
+        Args:
+            data: Job tuples, see `write_batch`.
+            changed: Whether the jobs changed since their job pages were queued.
 
         Returns:
             None
 
         """
+        pages = {record[6]: record[0] for record in data if record[6] and record[6] != record[7]}
+        if not pages:
+            return
         query = f"""
-            SELECT client_id, url FROM {table};
+            INSERT INTO job_queue (url_hash, job_page_url, client_id, last_seen, due_at)
+            VALUES (SHA2(%s, 256), %s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE last_seen = NOW(){", due_at = NOW()" if changed else ""};
+        """
+        self.cursor.executemany(query, [(url, url, client_id) for url, client_id in pages.items()])
+
+
+    def dequeue(self, urls: List[str], table: str = "overview") -> None:
         """
-        self.cursor.execute(query)
-        return [{item.get("client_id"): item.get("url")} for item in self.cursor.fetchall() if item.get("url")]
+        Removes job pages that no record of the table lists anymore from the job queue; the caller commits.
 
+        A job page still listed by another source or client stays queued.
 
-    def lookup(self, url: str, table: str) -> bool:
+        Args:
+            urls: The job page URLs of removed records.
+            table: The jobs table listing the job pages.
+
+        Returns:
+            None
+
+        """
+        urls = [url for url in dict.fromkeys(urls) if url]
+        for i in range(0, len(urls), 500):
+            batch = urls[i:i + 500]
+            self.cursor.execute(f"""
+                DELETE FROM job_queue
+                WHERE url_hash IN ({", ".join(["SHA2(%s, 256)"] * len(batch))})
+                AND NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.job_page_url = job_queue.job_page_url);
+            """, batch)
+
+
+    @pooled
+    def claim_queue(self, limit: int = 500, lease: int = 3600, queue: str = "job_queue") -> List[Tuple[int, str]]:
         """
-        checking if a URL exists in the database.
+        Claims a batch of queued pages that are new, changed or due for a refresh.
+
+        Claimed pages are leased for `lease` seconds; pages that are not
+        completed in time, e.g. because their fetch failed, become claimable again.
 
         Args:
-            url: The URL to check for in the database.
+            limit: The maximum number of pages to claim.
+            lease: The seconds until an uncompleted claim expires.
+            queue: The crawl queue, "job_queue" or "url_schedule".
 
         Returns:
-            True if the URL exists in the database and not older than max_age, False otherwise.
+            The (client_id, url) pairs, most overdue first.
 
         """
+        column = schema.QUEUES[queue]
         try:
-            table_creation_sql = f"""CREATE TABLE IF NOT EXISTS {table} 
-                (
-                id INT AUTO_INCREMENT PRIMARY KEY, 
-                client_id INT, 
-                title VARCHAR(255), 
-                description TEXT, 
-                token_cost VARCHAR(255), 
-                scraping_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-                scraping_end_time TIMESTAMP,
-                job_page_url VARCHAR(255),
-                source VARCHAR(255)
-                )
-                """
-            self.cursor.execute(table_creation_sql)
+            self.cursor.execute(f"""
+                SELECT url_hash, client_id, {column} FROM {queue}
+                WHERE due_at <= NOW() AND (claimed_until IS NULL OR claimed_until < NOW())
+                ORDER BY due_at
+                LIMIT %s FOR UPDATE;
+            """, (limit,))
+            rows = self.cursor.fetchall()
+            if rows:
+                self.cursor.execute(f"""
+                    UPDATE {queue} SET claimed_until = NOW() + INTERVAL %s SECOND
+                    WHERE url_hash IN ({", ".join(["%s"] * len(rows))});
+                """, [lease] + [row.get("url_hash") for row in rows])
             self.connection.commit()
-
-            query = f"""
-                SELECT source, scraping_end_time  FROM {table}
-                WHERE source = '{url}';
-            """
-            self.cursor.execute(query)
-            exist = self.cursor.fetchone()
-            if exist:
-                last_time_scraped = exist.get("scraping_end_time")
-                return (datetime.datetime.now() - last_time_scraped).days <= self.max_age
-            else:
-                return False  
         except Exception:
-            return False
-                  
+            self.connection.rollback()
+            raise
+        return [(row.get("client_id"), row.get(column)) for row in rows]
+
 
-    def delete_if_exists(self, table: str, key: str) -> None:
+    def complete(self, urls: List[str], queue: str = "job_queue", changed: Set[str] = frozenset()) -> None:
         """
-        Deletes a row from the specified table if it exists, based on the given key.
+        Marks queued pages as crawled and schedules their next crawl; the caller commits.
+
+        The outcome of the crawl is added to the page's change history, and
+        the recrawl interval is adapted to it, see `RecrawlPolicy`. Pages
+        start out with an interval of max_age days.
 
         Args:
-            table (str): The name of the table to delete from.
-            key (str): The key to identify the row to be deleted.
+            urls: The URLs of the pages.
+            queue: The crawl queue, "job_queue" or "url_schedule".
+            changed: The URLs whose jobs or text changed in this crawl.
 
         Returns:
             None
+
         """
-        drop_query = f"""
-            DELETE FROM {table}
-            WHERE source = '{key}';
+        column = schema.QUEUES[queue]
+        for i in range(0, len(urls), 500):
+            batch = urls[i:i + 500]
+            self.cursor.execute(f"""
+                SELECT url_hash, {column}, recrawl_hours, change_history, crawled_at FROM {queue}
+                WHERE url_hash IN ({", ".join(["SHA2(%s, 256)"] * len(batch))});
+            """, batch)
+            updates = []
+            for row in self.cursor.fetchall():
+                history = row.get("change_history") or ""
+                hours = row.get("recrawl_hours") or self.max_age * 24
+                # the first crawl of a page finds everything new, which says nothing about its change rate
+                if row.get("crawled_at") is not None:
+                    history = self.recrawl.record(history, row.get(column) in changed)
+                    hours = self.recrawl.next_interval(hours, history)
+                updates.append((history, hours, int(hours * 3600), row.get("url_hash")))
+            self.cursor.executemany(f"""
+                UPDATE {queue} SET crawled_at = NOW(), claimed_until = NULL,
+                change_history = %s, recrawl_hours = %s, due_at = NOW() + INTERVAL %s SECOND
+                WHERE url_hash = %s;
+            """, updates)
+
+
+    def _changed_fingerprints(self, fingerprints: Dict[Tuple[str, str], Tuple[str, List[Dict]]]) -> Set[str]:
+        # the sources whose stored fingerprint differs from the new one
+        keys = list(fingerprints)
+        changed = {source for _, source in keys}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            self.cursor.execute(f"""
+                SELECT table_name, source, fingerprint FROM fingerprints
+                WHERE (table_name, source_hash) IN ({", ".join(["(%s, SHA2(%s, 256))"] * len(batch))});
+            """, [value for key in batch for value in key])
+            for row in self.cursor.fetchall():
+                key = (row.get("table_name"), row.get("source"))
+                if fingerprints[key][0] == row.get("fingerprint"):
+                    changed.discard(row.get("source"))
+        return changed
+
+
+    @pooled
+    def queue_stats(self, queue: str = "job_queue") -> Dict:
+        """
+        Measures the backlog of a crawl queue.
+
+        Args:
+            queue: The crawl queue, "job_queue" or "url_schedule".
+
+        Returns:
+            The number of unclaimed pages that are due, and the lag in seconds:
+            how long the most overdue page has been waiting, or, when nothing
+            is due, minus the seconds until the next page is. None if the queue is empty.
+
         """
-        self.cursor.execute(drop_query)
+        self.cursor.execute(f"""
+            SELECT COALESCE(SUM(due_at <= NOW()), 0) AS backlog, TIMESTAMPDIFF(SECOND, MIN(due_at), NOW()) AS lag FROM {queue}
+            WHERE claimed_until IS NULL OR claimed_until < NOW();
+        """)
+        row = self.cursor.fetchone()
         self.connection.commit()
+        return {"backlog": int(row.get("backlog")), "lag_seconds": row.get("lag")}
+
+
+    @pooled
+    def sync_url_schedule(self) -> int:
+        """
+        Schedules the websites added to the urls table and drops the removed ones.
+
+        A new website is due max_age days after its last crawl into the
+        overview table, or right away if it was never crawled.
 
+        Returns:
+            The number of websites added.
+
+        """
+        try:
+            added = self.cursor.execute("""
+                INSERT IGNORE INTO url_schedule (url_hash, url, client_id, due_at)
+                SELECT SHA2(u.url, 256), u.url, MIN(u.client_id), COALESCE(MAX(o.scraping_end_time) + INTERVAL %s DAY, NOW())
+                FROM urls u LEFT JOIN overview o ON o.source = u.url
+                WHERE u.url IS NOT NULL AND u.url <> ''
+                AND SHA2(u.url, 256) NOT IN (SELECT url_hash FROM url_schedule)
+                GROUP BY u.url;
+            """, (self.max_age,))
+            self.cursor.execute("""
+                DELETE FROM url_schedule
+                WHERE url_hash NOT IN (SELECT SHA2(url, 256) FROM urls WHERE url IS NOT NULL);
+            """)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return added
+
+
+    def _replace_rows(self, table: str, sources: Dict[str, List[Tuple]], batch_size: int) -> Tuple[Dict[str, int], List[Tuple], List[Tuple], Set[str], List[str]]:
+        # diff the stored jobs of every source against the new ones, then apply
+        # the differences with one statement per kind; the caller commits.
+        # Returns the counts, the new and changed records, the sources whose
+        # jobs changed and the job page URLs of the removed jobs.
+        existing = defaultdict(dict)
+        vanished, vanished_pages = [], []
+        names = list(sources)
+        for i in range(0, len(names), 500):
+            batch = names[i:i + 500]
+            self.cursor.execute(f"""
+                SELECT id, client_id, title, description, job_page_url, source FROM {table}
+                WHERE source IN ({", ".join(["%s"] * len(batch))}) FOR UPDATE;
+            """, batch)
+            for row in self.cursor.fetchall():
+                key = (row.get("job_page_url") or "", row.get("title") or "")
+                if key in existing[row.get("source")]:
+                    vanished.append(row.get("id"))
+                else:
+                    existing[row.get("source")][key] = row
+
+        new, changed, changed_records, times, unchanged = [], [], [], [], 0
+        touched = set()
+        for source, data in sources.items():
+            stored = existing.pop(source, {})
+            writes = len(new) + len(changed) + len(vanished)
+            for record in dict(((record[6] or "", record[1] or ""), record) for record in data).values():
+                row = stored.pop((record[6] or "", record[1] or ""), None)
+                if row is None:
+                    new.append(record)
+                elif row.get("client_id") != record[0] or (row.get("description") or "") != (record[2] or ""):
+                    changed.append((record[0], record[2], record[3], row.get("id")))
+                    changed_records.append(record)
+                else:
+                    unchanged += 1
+            vanished.extend(row.get("id") for row in stored.values())
+            vanished_pages.extend(row.get("job_page_url") for row in stored.values())
+            if len(new) + len(changed) + len(vanished) > writes:
+                touched.add(source)
+            if data:
+                times.append((data[0][4], data[0][5], source))
+
+        for i in range(0, len(vanished), 1000):
+            batch = vanished[i:i + 1000]
+            self.cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))});", batch)
+        if changed:
+            self.cursor.executemany(f"""
+                UPDATE {table} SET client_id = %s, description = %s, token_cost = %s
+                WHERE id = %s;
+            """, changed)
+        if times:
+            self.cursor.executemany(f"""
+                UPDATE {table} SET scraping_start_time = %s, scraping_end_time = %s
+                WHERE source = %s;
+            """, times)
+        for i in range(0, len(new), batch_size):
+            batch = new[i:i + batch_size]
+            self.cursor.execute(f"""INSERT INTO {table}
+                (
+                client_id,
+                title,
+                description,
+                token_cost,
+                scraping_start_time,
+                scraping_end_time,
+                job_page_url,
+                source
+                )
+                VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))}
+            """, [value for record in batch for value in record])
+        counts = {"inserted": len(new), "updated": len(changed), "deleted": len(vanished), "unchanged": unchanged}
+        return counts, new, changed_records, touched, vanished_pages
+
+
+    @pooled
+    def migrate(self) -> int:
+        """
+        Creates or upgrades the tables and indexes, see `schema.migrate`.
+        Run once at startup; the other methods assume the schema exists.
+
+        Returns:
+            The schema version.
 
-    def insert(self, data: List[Tuple], table: str, duplicates_key: str) -> None:
         """
-        Inserts data into the specified table in the database.
+        return schema.migrate(self.connection)
+
+
+    @pooled
+    def get_fingerprint(self, url: str, table: str) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Retrieves the content fingerprint and extraction result stored for a page.
 
         Args:
-            data: A list of tuples containing the data to be inserted.
-            table: The name of the table in the database.
+            url: The URL of the page.
+            table: The jobs table the page was extracted into.
 
         Returns:
-            None
+            The fingerprint and the list of extracted jobs, or None if the page was never extracted.
 
         """
-        table_creation_sql = f"""CREATE TABLE IF NOT EXISTS {table} 
-            (
-            id INT AUTO_INCREMENT PRIMARY KEY, 
-            client_id INT, 
-            title VARCHAR(255), 
-            description TEXT, 
-            token_cost VARCHAR(255), 
-            scraping_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-            scraping_end_time TIMESTAMP,
-            job_page_url VARCHAR(255),
-            source VARCHAR(255)
-            )
+        try:
+            query = """
+                SELECT fingerprint, jobs FROM fingerprints
+                WHERE table_name = %s AND source_hash = SHA2(%s, 256);
             """
-        self.cursor.execute(table_creation_sql)
-        self.connection.commit()
+            self.cursor.execute(query, (table, url))
+            row = self.cursor.fetchone()
+            if row:
+                return row.get("fingerprint"), json.loads(row.get("jobs"))
+        except pymysql.err.OperationalError:
+            # a lost connection, retried by `pooled`
+            raise
+        except Exception:
+            pass
+        return None
+
+
+    @pooled
+    def get_fetch_tiers(self, stage: str, reprobe_days: int = 7) -> Dict[str, str]:
+        """
+        Retrieves the fetch tier learned for each host by a crawl stage.
+
+        Hosts learned to need the browser more than `reprobe_days` ago are
+        left out, so the crawler tries them over plain HTTP again.
+
+        Args:
+            stage: The crawl stage, "overview" or "individual".
+            reprobe_days: The days a "browser" tier is trusted.
+
+        Returns:
+            A dict mapping hosts to "http" or "browser".
+
+        """
+        try:
+            self.cursor.execute("""
+                SELECT host, tier FROM fetch_tiers
+                WHERE stage = %s AND (tier <> 'browser' OR updated_at >= NOW() - INTERVAL %s DAY);
+            """, (stage, reprobe_days))
+            return {row.get("host"): row.get("tier") for row in self.cursor.fetchall()}
+        except pymysql.err.OperationalError:
+            # a lost connection, retried by `pooled`
+            raise
+        except Exception:
+            return {}
 
-        self.delete_if_exists(table, duplicates_key)
-
-        insert_sql = f"""INSERT INTO {table} 
-            (
-            client_id, 
-            title, 
-            description, 
-            token_cost,
-            scraping_start_time,
-            scraping_end_time,
-            job_page_url,
-            source
-            ) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        self.cursor.executemany(insert_sql, data)
+
+    @pooled
+    def save_fetch_tiers(self, tiers: Dict[str, str], stage: str) -> None:
+        """
+        Stores the fetch tier learned for each host by a crawl stage.
+
+        Args:
+            tiers: A dict mapping hosts to "http" or "browser".
+            stage: The crawl stage, "overview" or "individual".
+
+        Returns:
+            None
+
+        """
+        # updated_at is set explicitly, a re-probe that confirms the tier changes no other column
+        query = """
+            INSERT INTO fetch_tiers (stage, host, tier) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE tier = VALUES(tier), updated_at = NOW();
+        """
+        self.cursor.executemany(query, [(stage, host, tier) for host, tier in tiers.items()])
         self.connection.commit()
 
 
     def close_connection(self):
         """
-        Closes the database connection.
+        Closes the pooled database connections.
 
         Returns:
             None
 
         """
         try:
-            self.connection.close()
+            self.pool.close()
         except Exception:
             pass
 
 
     def __del__(self):
         """
-        Destructor method that closes the database connection.
+        Destructor method that closes the pooled database connections.
 
         Returns:
             None
 
         """
         self.close_connection()
+
+
+
+class WriteBuffer:
+    """
+    A write-behind buffer of job sets, flushed to the database in batches.
+
+    The job sets of many sources are collected and written together in one
+    transaction, see `DB.write_batch`, once `max_sources` sources or
+    `max_rows` rows are waiting or the oldest has waited `max_delay` seconds.
+    A later job set for a source replaces a pending one. A flush that failed
+    on a lost connection keeps its job sets for the next flush, at most
+    `max_retries` times. A batch the database rejected otherwise is bisected
+    until the offending job sets are found, which are dropped and logged.
+    """
+
+    def __init__(self, db: DB, max_sources: int = 100, max_rows: int = 5000, max_delay: float = 5.0, feed_queue: bool = False, drain_queue: Optional[str] = None, on_flush: Callable[[Dict[str, int]], None] = None, max_retries: int = 5) -> None:
+        """
+        Initializes the buffer and starts its timer thread.
+
+        Args:
+            db (DB): The database to flush to.
+            max_sources (int): The number of pending sources that triggers a flush. Defaults to 100.
+            max_rows (int): The number of pending rows that triggers a flush. Defaults to 5000.
+            max_delay (float): The seconds a job set may wait before it is flushed. Defaults to 5.0.
+            feed_queue (bool): Whether to queue the job pages of new and changed jobs for the individual stage. Defaults to False.
+            drain_queue (str, optional): The crawl queue whose entries for the written sources are marked as crawled. Defaults to None.
+            on_flush (callable, optional): Called with the written row counts after each successful flush.
+            max_retries (int): The number of flushes a job set is kept for after transient failures. Defaults to 5.
+
+        Returns:
+            None
+        """
+        self.db = db
+        self.max_sources = max_sources
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.feed_queue = feed_queue
+        self.drain_queue = drain_queue
+        self.on_flush = on_flush
+        self.max_retries = max_retries
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._pending: Dict[Tuple[str, str], List[Tuple]] = {}
+        self._fingerprints: Dict[Tuple[str, str], Tuple[str, List[Dict]]] = {}
+        self._rows = 0
+        self._since = None
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._closed = threading.Event()
+        self.reset_stats()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+
+    def _run(self) -> None:
+        while not self._closed.wait(self.max_delay / 4):
+            since = self._since
+            if since is not None and time.monotonic() - since >= self.max_delay:
+                self.flush()
+
+
+    def add(self, table: str, source: str, data: List[Tuple], fingerprint: str = None, jobs: List[Dict] = None) -> None:
+        """
+        Queues the job set of a source, flushing right away if the buffer is full.
+
+        Args:
+            table (str): The name of the jobs table.
+            source (str): The source URL of the jobs.
+            data (list): The job tuples, see `DB.write_batch`.
+            fingerprint (str, optional): The fingerprint of the page's cleaned text, stored with `jobs`.
+            jobs (list, optional): The extracted jobs stored with the fingerprint.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            key = (table, source)
+            self._rows += len(data) - len(self._pending.get(key, []))
+            self._pending[key] = data
+            if fingerprint:
+                self._fingerprints[key] = (fingerprint, jobs)
+            else:
+                self._fingerprints.pop(key, None)
+            if self._since is None:
+                self._since = time.monotonic()
+            full = len(self._pending) >= self.max_sources or self._rows >= self.max_rows
+        if full:
+            self.flush()
+
+
+    def flush(self) -> None:
+        """
+        Writes every pending job set in one transaction.
+
+        Returns:
+            None
+        """
+        with self._flushing:
+            with self._lock:
+                pending, fingerprints = self._pending, self._fingerprints
+                self._pending, self._fingerprints, self._rows, self._since = {}, {}, 0, None
+            if not pending and not fingerprints:
+                return
+            started = time.monotonic()
+            try:
+                written, retry, dropped = self._write(pending, fingerprints)
+            except BaseException:
+                # e.g. SIGTERM during the last flush of a run: keep the job sets for the flush at exit
+                self._requeue(pending, fingerprints, started)
+                raise
+            elapsed = time.monotonic() - started
+            for key in retry:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] > self.max_retries:
+                    logger.error(f"Dropping the jobs of {key[1]} after {self.max_retries} failed flushes")
+                    del self._attempts[key]
+                    dropped.append(key)
+            retry = [key for key in retry if key not in dropped]
+            done = [key for key in {**fingerprints, **pending} if key not in retry and key not in dropped]
+            for key in done:
+                self._attempts.pop(key, None)
+            rows = sum(len(pending.get(key, [])) for key in done)
+            if retry:
+                self._requeue({key: pending[key] for key in retry if key in pending}, {key: fingerprints[key] for key in retry if key in fingerprints}, started)
+            with self._lock:
+                if retry or dropped:
+                    self.failures += 1
+                self.dropped += len(dropped)
+                if done:
+                    self.flushes += 1
+                    self.rows += rows
+                    self.flush_seconds += elapsed
+                    self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                    self.written.update(written)
+            if not done:
+                return
+            metrics.DB_WRITE.observe(elapsed)
+            logger.info(f"Flushed {rows} rows of {len(done)} sources in {elapsed:.2f}s")
+        if self.on_flush is not None:
+            self.on_flush(written)
+
+
+    def _requeue(self, pending: Dict[Tuple[str, str], List[Tuple]], fingerprints: Dict, started: float) -> None:
+        # puts job sets back for the next flush; job sets queued meanwhile are newer and win
+        with self._lock:
+            newer = set(self._pending)
+            self._pending = {**pending, **self._pending}
+            self._fingerprints = {**{key: value for key, value in fingerprints.items() if key not in newer}, **self._fingerprints}
+            self._rows = sum(len(data) for data in self._pending.values())
+            self._since = self._since or started
+
+
+    def _write(self, pending: Dict[Tuple[str, str], List[Tuple]], fingerprints: Dict) -> Tuple[Counter, List[Tuple[str, str]], List[Tuple[str, str]]]:
+        # writes the job sets, bisecting a batch the database rejected; returns
+        # the written row counts, the job sets to retry and the dropped ones
+        try:
+            return Counter(self.db.write_batch(pending, fingerprints, feed_queue=self.feed_queue, drain_queue=self.drain_queue)), [], []
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+            metrics.FAILURES.inc(operation="db_write")
+            logger.error(f"Write-behind flush of {len(pending)} sources failed, keeping them for the next flush: {e!r}")
+            return Counter(), list({**fingerprints, **pending}), []
+        except Exception as e:
+            metrics.FAILURES.inc(operation="db_write")
+            keys = list({**fingerprints, **pending})
+            if len(keys) == 1:
+                logger.error(f"Dropping the jobs of {keys[0][1]}, the database rejected them: {e!r}")
+                return Counter(), [], keys
+            written, retry, dropped = Counter(), [], []
+            for half in (keys[:len(keys) // 2], keys[len(keys) // 2:]):
+                half_written, half_retry, half_dropped = self._write(
+                    {key: pending[key] for key in half if key in pending},
+                    {key: fingerprints[key] for key in half if key in fingerprints},
+                )
+                written.update(half_written)
+                retry += half_retry
+                dropped += half_dropped
+            return written, retry, dropped
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the buffer counters.
+
+        Returns:
+            dict: Flushes, rows written, rows per second of flush time, average and max flush seconds, pending rows, failed flushes, dropped job sets, and the rows inserted, updated, deleted and left unchanged.
+        """
+        with self._lock:
+            return {
+                "flushes": self.flushes,
+                "rows": self.rows,
+                "rows_per_second": round(self.rows / self.flush_seconds, 1) if self.flush_seconds else 0.0,
+                "average_flush_seconds": round(self.flush_seconds / self.flushes, 3) if self.flushes else 0.0,
+                "max_flush_seconds": round(self.max_flush_seconds, 3),
+                "pending_rows": self._rows,
+                "failures": self.failures,
+                "dropped": self.dropped,
+                **self.written,
+            }
+
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters, e.g. at the start of a run.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.flushes = self.rows = self.failures = self.dropped = 0
+            self.flush_seconds = self.max_flush_seconds = 0.0
+            self.written = Counter(inserted=0, updated=0, deleted=0, unchanged=0)
+
+
+    def close(self) -> None:
+        """
+        Stops the timer thread and flushes what is still pending.
+
+        Returns:
+            None
+        """
+        self._closed.set()
+        self._thread.join()
+        self.flush()
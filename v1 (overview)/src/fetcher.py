@@ -0,0 +1,165 @@
+from bs4 import BeautifulSoup
+from dataclasses import dataclass
+from typing import Dict, Optional
+import logging
+import httpx
+import re
+
+from src.logger import logger
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+
+@dataclass
+class HttpReply:
+    status_code: int
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# Markers of pages that only render with JavaScript
+SPA_PATTERN = re.compile(r"enable javascript|javascript is (disabled|required)|<div id=\"(root|app|__next)\">\s*</div>", re.I)
+
+
+def looks_rendered(html: str, min_text: int = 500, min_links: int = 5) -> bool:
+    """
+    Guesses whether server-rendered HTML already contains the page content.
+
+    Args:
+        html (str): The HTML as returned by the server.
+        min_text (int): The minimum visible text length. Defaults to 500.
+        min_links (int): The minimum number of links. Defaults to 5.
+
+    Returns:
+        bool: True if the page does not need a browser to render.
+    """
+    if SPA_PATTERN.search(html):
+        return False
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    text = " ".join(soup.get_text(" ").split())
+    return len(text) >= min_text and len(soup.find_all("a", href=True)) >= min_links
+
+
+
+class HttpFetcher:
+    """
+    The plain HTTP tier of the crawler.
+
+    Uses pooled keep-alive connections with gzip/brotli decoding, one client
+    for sync fetches and one for async fetches, created on first use.
+    """
+
+    def __init__(self, timeout: int = 20, max_connections: int = 32, max_keepalive: int = 16) -> None:
+        """
+        Initializes the fetcher.
+
+        Args:
+            timeout (int): The request timeout in seconds. Defaults to 20.
+            max_connections (int): The maximum number of pooled connections. Defaults to 32.
+            max_keepalive (int): The maximum number of idle connections kept alive. Defaults to 16.
+
+        Returns:
+            None
+        """
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client = None
+        self._async_client = None
+
+
+    def _headers(self, etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+
+    def _reply(self, url: str, reply: httpx.Response) -> Optional[HttpReply]:
+        if reply.status_code == 304:
+            return HttpReply(status_code=304, text="")
+        if reply.status_code != 200 or "html" not in reply.headers.get("content-type", "html"):
+            logger.info(f"HTTP tier got {reply.status_code} for {url}")
+            return None
+        return HttpReply(
+            status_code=200,
+            text=reply.text,
+            etag=reply.headers.get("etag"),
+            last_modified=reply.headers.get("last-modified"),
+        )
+
+
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[HttpReply]:
+        """
+        Fetches a page over plain HTTP, conditionally when validators are given.
+
+        Args:
+            url (str): The URL of the web page to fetch.
+            etag (str, optional): The ETag of the cached copy, sent as If-None-Match.
+            last_modified (str, optional): The Last-Modified of the cached copy, sent as If-Modified-Since.
+
+        Returns:
+            HttpReply: The 200 or 304 reply, or None if the request failed or returned no HTML.
+        """
+        if self._client is None:
+            self._client = httpx.Client(headers=HEADERS, timeout=self.timeout, limits=self.limits, follow_redirects=True)
+        try:
+            return self._reply(url, self._client.get(url, headers=self._headers(etag, last_modified)))
+        except httpx.HTTPError as e:
+            logger.info(f"HTTP tier failed for {url}: {e!r}")
+            return None
+
+
+    async def fetch_async(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[HttpReply]:
+        """
+        Async counterpart of `fetch`.
+
+        Args:
+            url (str): The URL of the web page to fetch.
+            etag (str, optional): The ETag of the cached copy, sent as If-None-Match.
+            last_modified (str, optional): The Last-Modified of the cached copy, sent as If-Modified-Since.
+
+        Returns:
+            HttpReply: The 200 or 304 reply, or None if the request failed or returned no HTML.
+        """
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(headers=HEADERS, timeout=self.timeout, limits=self.limits, follow_redirects=True)
+        try:
+            return self._reply(url, await self._async_client.get(url, headers=self._headers(etag, last_modified)))
+        except httpx.HTTPError as e:
+            logger.info(f"HTTP tier failed for {url}: {e!r}")
+            return None
+
+
+    def close(self) -> None:
+        """
+        Closes the sync client.
+
+        Returns:
+            None
+        """
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+    async def close_async(self) -> None:
+        """
+        Closes the async client.
+
+        Returns:
+            None
+        """
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -0,0 +1,451 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+import bisect
+import json
+import os
+import threading
+import time
+
+from src.logger import logger
+
+
+# Upper bounds of the latency buckets in seconds, from a DB round trip to a slow page
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _suffix(labels: Tuple[Tuple[str, str], ...]) -> str:
+    # the key of a labelled series in the JSON summary, e.g. "table=overview"
+    return ",".join(f"{key}={value}" for key, value in labels)
+
+
+
+class Counter:
+    """
+    A monotonically increasing total, optionally split by labels.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, name: str, description: str) -> None:
+        """
+        Initializes the counter at zero.
+
+        Args:
+            name (str): The metric name, in Prometheus naming.
+            description (str): The help text of the metric.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Adds to the counter.
+
+        Args:
+            amount (float): The amount to add. Defaults to 1.
+            **labels: The labels of the series, e.g. table="overview".
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(values.items())]
+        return lines
+
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {_suffix(key) or "total": round(value, 6) for key, value in sorted(self._values.items())}
+
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+
+class Gauge:
+    """
+    A value that goes up and down, optionally split by labels.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, name: str, description: str) -> None:
+        """
+        Initializes the gauge without series.
+
+        Args:
+            name (str): The metric name, in Prometheus naming.
+            description (str): The help text of the metric.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+
+    def set(self, value: Optional[float], **labels) -> None:
+        """
+        Sets the gauge.
+
+        Args:
+            value (float, optional): The current value, or None to drop the series while it is unknown.
+            **labels: The labels of the series, e.g. queue="job_queue".
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self._lock:
+            if value is None:
+                self._values.pop(key, None)
+            else:
+                self._values[key] = value
+
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(values.items())]
+        return lines
+
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {_suffix(key) or "total": round(value, 6) for key, value in sorted(self._values.items())}
+
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+
+class Histogram:
+    """
+    A distribution of durations in fixed buckets, optionally split by labels.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        """
+        Initializes an empty histogram.
+
+        Args:
+            name (str): The metric name, in Prometheus naming.
+            description (str): The help text of the metric.
+            buckets (tuple): The upper bounds of the buckets in seconds. Defaults to BUCKETS.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, seconds: float, **labels) -> None:
+        """
+        Records one duration.
+
+        Args:
+            seconds (float): The duration.
+            **labels: The labels of the series, e.g. table="overview".
+
+        Returns:
+            None
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0, "max": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+            series["max"] = max(series["max"], seconds)
+
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Records the duration of the enclosed block, also when it raises.
+
+        Args:
+            **labels: The labels of the series.
+
+        Yields:
+            None
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+    def _quantile(self, series: Dict, q: float) -> float:
+        # the upper bound of the bucket holding the q-th observation
+        rank = q * series["count"]
+        seen = 0
+        for bound, count in zip(self.buckets, series["counts"]):
+            seen += count
+            if seen >= rank:
+                return min(bound, series["max"])
+        return series["max"]
+
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: {**value, "counts": list(value["counts"])} for key, value in self._series.items()}
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, value in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, value["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {value['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {value['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {value['count']}")
+        return lines
+
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                _suffix(key) or "total": {
+                    "count": series["count"],
+                    "seconds": round(series["sum"], 3),
+                    "average": round(series["sum"] / series["count"], 4) if series["count"] else 0.0,
+                    "p50": self._quantile(series, 0.5),
+                    "p95": self._quantile(series, 0.95),
+                    "max": round(series["max"], 4),
+                }
+                for key, series in sorted(self._series.items())
+            }
+
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series = {}
+
+
+
+class Registry:
+    """
+    The metrics of the process, exported in the Prometheus text format over
+    HTTP and as a JSON summary.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty registry.
+
+        Returns:
+            None
+        """
+        self.metrics: Dict[str, object] = {}
+        self.started = time.time()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+
+    def counter(self, name: str, description: str) -> Counter:
+        """
+        Returns the counter of the given name, creating it on first use.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self.metrics.setdefault(name, Counter(name, description))
+
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        """
+        Returns the gauge of the given name, creating it on first use.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self.metrics.setdefault(name, Gauge(name, description))
+
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+        """
+        Returns the histogram of the given name, creating it on first use.
+
+        Args:
+            name (str): The metric name.
+            description (str): The help text of the metric.
+            buckets (tuple): The upper bounds of the buckets in seconds. Defaults to BUCKETS.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self.metrics.setdefault(name, Histogram(name, description, buckets))
+
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+    def summary(self) -> Dict:
+        """
+        Summarizes every metric, histograms with their p50 and p95.
+
+        Returns:
+            dict: The summary of each metric by name, and the seconds covered.
+        """
+        return {
+            "seconds": round(time.time() - self.started, 1),
+            **{name: metric.summary() for name, metric in self.metrics.items()},
+        }
+
+
+    def write_summary(self, path: str) -> None:
+        """
+        Writes the summary as JSON, replacing the previous one atomically.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            None
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+        os.replace(temporary, path)
+
+
+    def reset(self) -> None:
+        """
+        Resets every metric, e.g. to summarize one run at a time.
+
+        Returns:
+            None
+        """
+        for metric in self.metrics.values():
+            metric.reset()
+        self.started = time.time()
+
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> None:
+        """
+        Serves the metrics at http://host:port/metrics from a daemon thread.
+
+        Args:
+            port (int): The port to listen on. Defaults to 9100.
+            host (str): The address to bind. Defaults to "127.0.0.1".
+
+        Returns:
+            None
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+
+
+    def close(self) -> None:
+        """
+        Stops the metrics server.
+
+        Returns:
+            None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+
+# The metrics of this process, shared by every component
+REGISTRY = Registry()
+
+BROWSER_LAUNCH = REGISTRY.histogram("crawler_browser_launch_seconds", "Time to launch a browser and open its context")
+NAVIGATION = REGISTRY.histogram("crawler_navigation_seconds", "Time of page.goto in the browser")
+READINESS = REGISTRY.histogram("crawler_readiness_seconds", "Time from navigation until the page is ready")
+HTML2TEXT = REGISTRY.histogram("agent_html2text_seconds", "Time to prune a page and convert it to text")
+TOKENIZATION = REGISTRY.histogram("agent_tokenization_seconds", "Time to count the tokens of a text")
+LLM_CALL = REGISTRY.histogram("agent_llm_call_seconds", "Time of one extraction call to the model")
+DB_WRITE = REGISTRY.histogram("db_write_seconds", "Time of one write transaction of job records")
+
+PAGES = REGISTRY.counter("pages_total", "Pages written, by table and extraction path")
+JOBS = REGISTRY.counter("jobs_total", "Jobs extracted, by table")
+SKIPS = REGISTRY.counter("skips_total", "Pages or chunks not sent to the model, by reason")
+RETRIES = REGISTRY.counter("retries_total", "Retried operations, by operation")
+FAILURES = REGISTRY.counter("failures_total", "Failed operations, by operation")
+TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens used by the model, by kind")
+DOLLARS = REGISTRY.counter("llm_cost_dollars_total", "Cost of the model calls in US dollars")
+
+QUEUE_BACKLOG = REGISTRY.gauge("queue_backlog", "Due and unclaimed pages of a crawl queue, by queue")
+QUEUE_LAG = REGISTRY.gauge("queue_lag_seconds", "Seconds the most overdue page of a crawl queue has waited, negative until the next is due, by queue")
@@ -0,0 +1,224 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from playwright.sync_api import Page, Error
+from playwright.async_api import Page as AsyncPage
+import time
+
+from src.readiness import READY_JS
+
+
+# Elements that count as job listings when measuring whether a page grew
+JOB_SELECTOR = ", ".join([
+    '[itemtype*="JobPosting"]',
+    '[class*="job" i]',
+    '[id*="job" i]',
+    '[data-job-id]',
+    'a[href*="job" i]',
+    'a[href*="career" i]',
+    'a[href*="stelle" i]',
+    "article",
+    "li",
+])
+
+# The size of the page: its job-like elements plus its links
+SIZE_JS = """
+(selector) => document.querySelectorAll(selector).length + document.links.length
+"""
+
+# Takes one pagination action, skipping the exhausted ones, in the order
+# "load more" click, scroll to the bottom, next page. A next page is fetched
+# and its body appended to the current document, so the DOM accumulates every
+# page. Resolves to the action taken, or null when none is left.
+STEP_JS = """
+async ({skip, followNext}) => {
+    const LOAD_MORE = /^(load|show|view|see) (more|all)|^more (jobs|results|positions)|^mehr (anzeigen|laden|jobs|stellen)|^weitere/i;
+    const NEXT = /^(next( page)?|older|›|»|>|weiter|nächste( seite)?)$/i;
+    const visible = (el) => el.offsetParent !== null && !el.disabled && el.getAttribute("aria-disabled") !== "true";
+
+    if (!skip.includes("click")) {
+        const button = [...document.querySelectorAll('button, [role="button"], a:not([href]), a[href^="#"], a[href^="javascript"]')]
+            .find((el) => visible(el) && LOAD_MORE.test((el.innerText || "").trim()));
+        if (button) {
+            button.click();
+            return "click";
+        }
+    }
+
+    if (!skip.includes("scroll")) {
+        // back off and return to the bottom, so lazy loaders see the sentinel again
+        const bottom = document.body ? document.body.scrollHeight : 0;
+        window.scrollTo(0, Math.max(0, bottom - 2 * window.innerHeight));
+        window.scrollTo(0, bottom);
+        return "scroll";
+    }
+
+    if (followNext && !skip.includes("next")) {
+        window.__paginated = window.__paginated || [location.href];
+        const links = [...document.querySelectorAll('a[rel~="next"], link[rel~="next"], a[href]')]
+            .filter((el) => el.rel && el.rel.includes("next") || el.tagName === "A" && NEXT.test((el.innerText || el.getAttribute("aria-label") || "").trim()))
+            .map((el) => el.href)
+            .filter((href) => href && href.startsWith("http") && !window.__paginated.includes(href.split("#")[0]));
+        if (links.length) {
+            const href = links[links.length - 1].split("#")[0];
+            window.__paginated.push(href);
+            try {
+                const reply = await fetch(href, {credentials: "include"});
+                const next = new DOMParser().parseFromString(await reply.text(), "text/html");
+                const section = document.createElement("section");
+                section.setAttribute("data-paginated-from", href);
+                section.append(...next.body.childNodes);
+                document.body.append(section);
+            } catch (e) {}
+            return "next";
+        }
+    }
+    return null;
+}
+"""
+
+
+
+@dataclass
+class PaginationResult:
+    """
+    What the paginator did on one page.
+
+    Attributes:
+        steps: The number of actions taken.
+        actions: The number of steps per action ("click", "scroll" or "next").
+        items: The size of the page before and after paginating, see SIZE_JS.
+        seconds: The time spent paginating.
+        stop: Why pagination ended: "exhausted", "steps", "time" or "error".
+    """
+
+    steps: int = 0
+    actions: Counter = field(default_factory=Counter)
+    items: tuple = (0, 0)
+    seconds: float = 0.0
+    stop: str = "exhausted"
+
+
+
+class Paginator:
+    """
+    Reveals the jobs of infinite-scroll, "load more" and paged job boards.
+
+    After the page is ready, the paginator repeatedly clicks a "load more"
+    button, scrolls to the bottom or appends the next page, and waits for the
+    DOM to settle after each step. An action that did not grow the page is
+    skipped until another one does, and pagination ends once no action is
+    left, or after `max_steps` steps or `max_seconds` seconds. The page then
+    holds every loaded job, so its content is read once.
+    """
+
+    def __init__(self, max_steps: int = 20, max_seconds: float = 30.0, step_timeout: int = 5000, quiet: int = 500, follow_next: bool = True) -> None:
+        """
+        Initializes the paginator.
+
+        Args:
+            max_steps (int): The maximum number of actions per page. Defaults to 20.
+            max_seconds (float): The maximum time spent paginating a page. Defaults to 30.0.
+            step_timeout (int): The longest wait, in milliseconds, for the page to settle after an action. Defaults to 5000.
+            quiet (int): The quiescence window in milliseconds, see `wait_until_ready`. Defaults to 500.
+            follow_next (bool): Whether to append the pages behind "next" links. Defaults to True.
+
+        Returns:
+            None
+        """
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.step_timeout = step_timeout
+        self.quiet = quiet
+        self.follow_next = follow_next
+
+
+    def _settle_ms(self, started: float) -> int:
+        # wait at most the step timeout, and never past the time cap
+        remaining = self.max_seconds - (time.monotonic() - started)
+        return int(min(self.step_timeout, remaining * 1000))
+
+
+    def _stopped(self, result: PaginationResult, started: float) -> bool:
+        if result.steps >= self.max_steps:
+            result.stop = "steps"
+        elif time.monotonic() - started >= self.max_seconds:
+            result.stop = "time"
+        else:
+            return False
+        return True
+
+
+    def run(self, page: Page) -> PaginationResult:
+        """
+        Paginates a page until it stops growing or a cap is reached.
+
+        Args:
+            page: The Playwright page object, once ready.
+
+        Returns:
+            PaginationResult: The steps taken and how much the page grew.
+        """
+        started = time.monotonic()
+        result = PaginationResult()
+        first = size = page.evaluate(SIZE_JS, JOB_SELECTOR)
+        skip = set()
+        try:
+            while not self._stopped(result, started):
+                action = page.evaluate(STEP_JS, {"skip": list(skip), "followNext": self.follow_next})
+                if action is None:
+                    break
+                result.steps += 1
+                result.actions[action] += 1
+                settle = self._settle_ms(started)
+                if settle > 0:
+                    page.evaluate(READY_JS, {"quiet": self.quiet, "ceiling": settle})
+                grown = page.evaluate(SIZE_JS, JOB_SELECTOR)
+                if grown > size:
+                    skip.clear()
+                else:
+                    skip.add(action)
+                size = grown
+        except Error:
+            # e.g. a "load more" control that navigated away; the page is read as it is
+            result.stop = "error"
+        result.items = (first, size)
+        result.seconds = time.monotonic() - started
+        return result
+
+
+    async def run_async(self, page: AsyncPage) -> PaginationResult:
+        """
+        Async counterpart of `run`.
+
+        Args:
+            page: The async Playwright page object, once ready.
+
+        Returns:
+            PaginationResult: The steps taken and how much the page grew.
+        """
+        started = time.monotonic()
+        result = PaginationResult()
+        first = size = await page.evaluate(SIZE_JS, JOB_SELECTOR)
+        skip = set()
+        try:
+            while not self._stopped(result, started):
+                action = await page.evaluate(STEP_JS, {"skip": list(skip), "followNext": self.follow_next})
+                if action is None:
+                    break
+                result.steps += 1
+                result.actions[action] += 1
+                settle = self._settle_ms(started)
+                if settle > 0:
+                    await page.evaluate(READY_JS, {"quiet": self.quiet, "ceiling": settle})
+                grown = await page.evaluate(SIZE_JS, JOB_SELECTOR)
+                if grown > size:
+                    skip.clear()
+                else:
+                    skip.add(action)
+                size = grown
+        except Error:
+            # e.g. a "load more" control that navigated away; the page is read as it is
+            result.stop = "error"
+        result.items = (first, size)
+        result.seconds = time.monotonic() - started
+        return result
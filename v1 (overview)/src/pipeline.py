@@ -0,0 +1,265 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+import datetime
+import threading
+import queue
+import time
+
+from src.crawler import Response
+from src import metrics
+from src.logger import logger
+
+
+_STOP = object()
+
+
+@dataclass
+class PageTask:
+    """
+    A crawled page travelling through the pipeline stages.
+    """
+    client_id: int
+    response: Response
+    table: str
+    text: str = ""
+    fingerprint: str = ""
+    cached: bool = False
+    path: str = ""
+    jobs: List[Dict] = field(default_factory=list)
+    failed: int = 0
+    start_time: datetime.datetime = None
+    end_time: datetime.datetime = None
+
+
+
+class Stage:
+    """
+    A pool of worker threads applying a function to the items of a bounded queue.
+
+    The function returns the item to hand to the next stage, or None to drop it.
+    A full queue blocks the previous stage, which gives backpressure.
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int = 1, queue_size: int = 16) -> None:
+        """
+        Initializes the stage.
+
+        Args:
+            name (str): The name used in logs and stats.
+            fn (Callable): The function applied to each item.
+            workers (int): The number of worker threads. Defaults to 1.
+            queue_size (int): The capacity of the stage's input queue. Defaults to 16.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started = None
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+
+    def start(self, downstream: Optional["Stage"]) -> None:
+        """
+        Starts the worker threads.
+
+        Args:
+            downstream: The stage receiving this stage's results, if any.
+
+        Returns:
+            None
+        """
+        self.started = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._work, args=(downstream,), name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def _work(self, downstream: Optional["Stage"]) -> None:
+        while True:
+            item = self.inbox.get()
+            if item is _STOP:
+                return
+            began = time.monotonic()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                result = None
+                with self._lock:
+                    self.failed += 1
+                metrics.FAILURES.inc(operation=self.name)
+                logger.error(f"{self.name} failed: {e!r}")
+            else:
+                with self._lock:
+                    self.processed += 1
+            with self._lock:
+                self.busy += time.monotonic() - began
+            if result is not None and downstream is not None:
+                downstream.inbox.put(result)
+
+
+    def drain(self) -> None:
+        """
+        Lets the workers finish the queued items, then stops them.
+
+        Returns:
+            None
+        """
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the stage's counters.
+
+        Returns:
+            dict: Items processed and failed, current queue depth, busy seconds and items per second.
+        """
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "failed": self.failed,
+                "queue_depth": self.inbox.qsize(),
+                "busy_seconds": round(self.busy, 1),
+                "per_second": round(self.processed / elapsed, 2) if elapsed else 0.0,
+            }
+
+
+
+class Pipeline:
+    """
+    A chain of stages fed from an iterable in the calling thread.
+
+    The source is consumed in the calling thread, so it may drive thread-bound
+    resources such as a sync Playwright browser. On exhaustion, `stop()` or a
+    KeyboardInterrupt, the stages are drained in order before `run` returns.
+    """
+
+    def __init__(self, stages: List[Stage], report_every: float = 30.0, source_name: str = "source") -> None:
+        """
+        Initializes the pipeline.
+
+        Args:
+            stages (list): The stages, in order.
+            report_every (float): The seconds between progress logs. Defaults to 30.0.
+            source_name (str): The name of the source in logs and stats. Defaults to "source".
+
+        Returns:
+            None
+        """
+        self.stages = stages
+        self.report_every = report_every
+        self.source_name = source_name
+        self._stopping = threading.Event()
+        self._source_count = 0
+        self._source_busy = 0.0
+        self._started = None
+
+
+    def stop(self) -> None:
+        """
+        Stops consuming the source; queued items are still processed.
+
+        Returns:
+            None
+        """
+        self._stopping.set()
+
+
+    def _report(self, done: threading.Event) -> None:
+        while not done.wait(self.report_every):
+            self.log_stats()
+
+
+    def run(self, source: Iterable) -> Dict:
+        """
+        Feeds every item of the source through the stages and waits for them to drain.
+
+        Args:
+            source: The items for the first stage.
+
+        Returns:
+            dict: The stats of each stage, see `stats`.
+        """
+        for stage, downstream in zip(self.stages, self.stages[1:] + [None]):
+            stage.start(downstream)
+        done = threading.Event()
+        threading.Thread(target=self._report, args=(done,), daemon=True).start()
+
+        interrupted = False
+        self._started = time.monotonic()
+        try:
+            items = iter(source)
+            while True:
+                # the time spent waiting for the source, e.g. for the next fetched page
+                began = time.monotonic()
+                item = next(items, _STOP)
+                self._source_busy += time.monotonic() - began
+                if item is _STOP:
+                    break
+                self._source_count += 1
+                self.stages[0].inbox.put(item)
+                if self._stopping.is_set():
+                    break
+        except KeyboardInterrupt:
+            interrupted = True
+            logger.info("Shutting down, draining pipeline")
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+            for stage in self.stages:
+                stage.drain()
+            done.set()
+            self.log_stats()
+
+        if interrupted:
+            raise KeyboardInterrupt
+        return self.stats()
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the counters of the source and of each stage.
+
+        Returns:
+            dict: The stats keyed by stage name.
+        """
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        stats = {
+            self.source_name: {
+                "processed": self._source_count,
+                "busy_seconds": round(self._source_busy, 1),
+                "per_second": round(self._source_count / elapsed, 2) if elapsed else 0.0,
+            }
+        }
+        for stage in self.stages:
+            stats[stage.name] = stage.stats()
+        return stats
+
+
+    def log_stats(self) -> None:
+        """
+        Logs the counters of each stage.
+
+        Returns:
+            None
+        """
+        source = self.stats()[self.source_name]
+        parts = [f"{self.source_name} {source['processed']} done ({source['per_second']}/s)"]
+        for stage in self.stages:
+            stats = stage.stats()
+            parts.append(f"{stage.name} {stats['processed']} done/{stats['failed']} failed/{stats['queue_depth']} queued ({stats['per_second']}/s)")
+        logger.info("Pipeline: " + ", ".join(parts))
@@ -0,0 +1,123 @@
+from bs4 import BeautifulSoup, Comment, Tag
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import html as markup
+import re
+
+
+# Tags that never hold job content
+BOILERPLATE_TAGS = ["script", "style", "noscript", "svg", "nav", "iframe", "template", "button", "select"]
+
+# Page chrome, dropped unless it belongs to an item such as a job card
+CHROME_TAGS = ["header", "footer"]
+
+# Cookie banners, consent dialogs and newsletter popups, matched on id/class
+OVERLAY_PATTERN = re.compile(r"cookie|consent|gdpr|newsletter", re.I)
+
+# Page containers that consent managers tag with their state, e.g. "cookie-consent-pending"; never overlays
+CONTAINER_TAGS = ["html", "body", "main"]
+
+# Block elements whose text is compared when collapsing repeated boilerplate
+TEXT_BLOCKS = ["p", "div", "section", "aside", "span", "li"]
+
+
+def _signature(tag: Tag) -> Tuple[str, Tuple[str, ...]]:
+    return tag.name, tuple(sorted(tag.get("class") or []))
+
+
+def _is_overlay(tag: Tag) -> bool:
+    if tag.attrs is None or tag.name in CONTAINER_TAGS:
+        return False
+    names = " ".join([tag.get("id") or ""] + list(tag.get("class") or []))
+    return bool(OVERLAY_PATTERN.search(names))
+
+
+def _collapse_repeats(soup: BeautifulSoup, min_length: int = 80) -> None:
+    # keep the first copy of long text blocks that appear more than once,
+    # e.g. a disclaimer repeated in every card
+    seen = set()
+    for tag in soup.find_all(TEXT_BLOCKS):
+        if tag.decomposed or tag.find(TEXT_BLOCKS):
+            continue
+        text = " ".join(tag.get_text(" ").split())
+        if len(text) < min_length:
+            continue
+        if text in seen:
+            tag.decompose()
+        else:
+            seen.add(text)
+
+
+def find_listings(soup: BeautifulSoup, min_items: int = 3) -> List[Tag]:
+    """
+    Finds the subtrees that look like job listings.
+
+    A listing is an element with at least `min_items` children of the same tag
+    and class that each contain a link, e.g. the rows of a job board. Listings
+    scoring at least half of the best one are kept, outermost first.
+
+    Args:
+        soup: The parsed page.
+        min_items (int): The minimum number of repeated children. Defaults to 3.
+
+    Returns:
+        list: The listing elements, in document order.
+    """
+    scores: Dict[int, int] = {}
+    for tag in soup.find_all(True):
+        groups: Dict[Tuple, int] = defaultdict(int)
+        for child in tag.find_all(True, recursive=False):
+            if child.name == "a" or child.find("a", href=True):
+                groups[_signature(child)] += 1
+        if groups:
+            best = max(groups.values())
+            if best >= min_items:
+                scores[id(tag)] = best
+    if not scores:
+        return []
+
+    threshold = max(min_items, max(scores.values()) / 2)
+    listings, chosen = [], set()
+    for tag in soup.find_all(True):
+        if scores.get(id(tag), 0) >= threshold and not any(id(parent) in chosen for parent in tag.parents):
+            listings.append(tag)
+            chosen.add(id(tag))
+    return listings
+
+
+def prune(html: str, listings_only: bool = False) -> str:
+    """
+    Strips a page down to the markup that can hold job information.
+
+    Drops scripts, styles, navigation, page headers and footers, and cookie or
+    newsletter overlays, collapses repeated boilerplate blocks and, optionally,
+    keeps only the subtrees that look like job listings. An element named like
+    an overlay that holds most of the page's text is an app wrapper and is kept.
+
+    Args:
+        html (str): The page HTML.
+        listings_only (bool): Whether to keep only the listing subtrees when any are found. Defaults to False.
+
+    Returns:
+        str: The pruned HTML.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in soup(CHROME_TAGS):
+        if not tag.decomposed and not tag.find_parent(["article", "li"]):
+            tag.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    total = len(soup.get_text(" ", strip=True))
+    for tag in soup.find_all(_is_overlay):
+        if not tag.decomposed and len(tag.get_text(" ", strip=True)) * 2 <= total:
+            tag.decompose()
+    _collapse_repeats(soup)
+
+    if listings_only:
+        listings = find_listings(soup)
+        if listings:
+            title = soup.title.get_text(" ", strip=True) if soup.title else ""
+            return f"<h1>{markup.escape(title)}</h1>" + "".join(str(tag) for tag in listings)
+    return str(soup)
@@ -0,0 +1,87 @@
+from playwright.sync_api import Page, TimeoutError
+from playwright.async_api import Page as AsyncPage, TimeoutError as AsyncTimeoutError
+import time
+
+
+# Scrolls to the bottom and resolves once the DOM saw no mutation and the body
+# height stayed the same for `quiet` ms, or once `ceiling` ms have passed.
+READY_JS = """
+({quiet, ceiling}) => new Promise((resolve) => {
+    const started = performance.now();
+    let lastChange = started;
+    let height = document.body ? document.body.scrollHeight : 0;
+    const observer = new MutationObserver(() => { lastChange = performance.now(); });
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    window.scrollTo(0, document.body ? document.body.scrollHeight : 0);
+
+    const timer = setInterval(() => {
+        const now = performance.now();
+        const current = document.body ? document.body.scrollHeight : 0;
+        if (current !== height) {
+            height = current;
+            lastChange = now;
+            window.scrollTo(0, current);
+        }
+        const quietFor = now - lastChange;
+        if (quietFor >= quiet || now - started >= ceiling) {
+            clearInterval(timer);
+            observer.disconnect();
+            resolve(quietFor >= quiet ? "quiet" : "ceiling");
+        }
+    }, 100);
+})
+"""
+
+
+def wait_until_ready(page: Page, ceiling: int, quiet: int = 500, network_idle: bool = True) -> float:
+    """
+    Waits until a page has finished rendering, instead of sleeping a fixed time.
+
+    The page counts as ready once the network is idle, the DOM stopped changing
+    and the body height stayed stable after scrolling to the bottom, each for
+    `quiet` ms. `ceiling` bounds the whole wait.
+
+    Args:
+        page: The Playwright page object, after navigation.
+        ceiling (int): The maximum time to wait in milliseconds.
+        quiet (int): The quiescence window in milliseconds. Defaults to 500.
+        network_idle (bool): Whether to wait for network idle first. Defaults to True.
+
+    Returns:
+        float: The time to ready in seconds.
+    """
+    started = time.monotonic()
+    if network_idle:
+        try:
+            page.wait_for_load_state("networkidle", timeout=ceiling)
+        except TimeoutError:
+            pass
+    remaining = ceiling - (time.monotonic() - started) * 1000
+    if remaining > 0:
+        page.evaluate(READY_JS, {"quiet": quiet, "ceiling": remaining})
+    return time.monotonic() - started
+
+
+async def wait_until_ready_async(page: AsyncPage, ceiling: int, quiet: int = 500, network_idle: bool = True) -> float:
+    """
+    Async counterpart of `wait_until_ready`.
+
+    Args:
+        page: The async Playwright page object, after navigation.
+        ceiling (int): The maximum time to wait in milliseconds.
+        quiet (int): The quiescence window in milliseconds. Defaults to 500.
+        network_idle (bool): Whether to wait for network idle first. Defaults to True.
+
+    Returns:
+        float: The time to ready in seconds.
+    """
+    started = time.monotonic()
+    if network_idle:
+        try:
+            await page.wait_for_load_state("networkidle", timeout=ceiling)
+        except AsyncTimeoutError:
+            pass
+    remaining = ceiling - (time.monotonic() - started) * 1000
+    if remaining > 0:
+        await page.evaluate(READY_JS, {"quiet": quiet, "ceiling": remaining})
+    return time.monotonic() - started
@@ -0,0 +1,229 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+import datetime
+
+from src.agent import Agent
+from src.cache import ResponseCache
+from src.crawler import Crawler
+from src.db import DB, WriteBuffer
+from src.pipeline import Pipeline, PageTask, Stage
+from src import metrics
+from src.logger import logger
+
+
+def make_abs_url(base, url):
+    if url:
+        if url.startswith("http"):
+            return url
+        else:
+            return urljoin(base, url)
+
+
+
+class StageRunner:
+    """
+    One crawl stage: fetches the due pages of a jobs table, extracts their
+    jobs and queues them for writing.
+
+    The pages flow through the clean, extract and write steps of a Pipeline
+    while the crawler is still fetching. The components are long-lived and may
+    be shared with other stages in the same process.
+    """
+
+    def __init__(self, table: str, mysql: DB, crawler: Crawler, agent: Agent, writer: WriteBuffer, listings_only: bool = False, concurrency: int = 8, per_host: int = 2, min_delay: float = 1.0) -> None:
+        """
+        Initializes the stage.
+
+        Args:
+            table (str): The jobs table the stage writes to.
+            mysql (DB): The database.
+            crawler (Crawler): The crawler fetching the pages.
+            agent (Agent): The agent extracting the jobs.
+            writer (WriteBuffer): The write-behind buffer of the jobs table.
+            listings_only (bool): Whether to send only the job listing parts of a page to the model. Defaults to False.
+            concurrency (int): The maximum number of pages in flight. Defaults to 8.
+            per_host (int): The maximum number of pages in flight per host. Defaults to 2.
+            min_delay (float): The minimum seconds between two fetches to the same host. Defaults to 1.0.
+
+        Returns:
+            None
+        """
+        self.table = table
+        self.mysql = mysql
+        self.crawler = crawler
+        self.agent = agent
+        self.writer = writer
+        self.listings_only = listings_only
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.min_delay = min_delay
+        self.paths = Counter()
+        self._pipeline: Optional[Pipeline] = None
+
+
+    def clean(self, task: PageTask) -> PageTask:
+        # The server says the page has not changed: reuse the previous extraction
+        if task.response.not_modified:
+            previous = self.mysql.get_fingerprint(task.response.url, table=task.table)
+            if previous:
+                task.cached = True
+                task.path = "not-modified"
+                task.jobs = previous[1]
+                return task
+
+        # Read the jobs straight from structured markup when the page has it
+        task.path, task.jobs = self.agent.extract_structured(task.response)
+        if task.path:
+            return task
+
+        # Convert the crawled HTML into text for the model
+        task.text = self.agent.clean(task.response, listings_only=self.listings_only)
+
+        # Reuse the previous extraction when the page text has not changed
+        task.fingerprint = self.agent.fingerprint(task.text)
+        previous = self.mysql.get_fingerprint(task.response.url, table=task.table)
+        if previous and previous[0] == task.fingerprint:
+            task.cached = True
+            task.path = "cache"
+            task.jobs = previous[1]
+        return task
+
+
+    def extract(self, task: PageTask) -> PageTask:
+        # Record the start time of the scraping process
+        task.start_time = datetime.datetime.now()
+
+        # Extract job information from the crawled response, unless already known
+        if not task.path:
+            task.path = "llm"
+            task.jobs, task.failed = self.agent.extract_text(task.text)
+
+        # Record the end time of the scraping process
+        task.end_time = datetime.datetime.now()
+        return task
+
+
+    def write(self, task: PageTask) -> None:
+        response = task.response
+
+        # Keep the stored jobs of a page the model could not read at all; it is crawled again next run
+        if task.failed and not task.jobs:
+            logger.warning(f"Extraction failed for all chunks, keeping the previous jobs: {response.url}")
+            return
+        self.paths[task.path] += 1
+        metrics.PAGES.inc(table=task.table, path=task.path)
+        metrics.JOBS.inc(len(task.jobs), table=task.table)
+        if task.path != "llm":
+            metrics.SKIPS.inc(reason=task.path)
+        logger.info(f"Extracted {len(task.jobs)} jobs via {task.path}: {response.url}")
+
+        # Prepare job records for database insertion
+        records = [
+            (
+                task.client_id,  # Random ID for the job record
+                job["job_title"],          # Extracted job title
+                job["job_description"],    # Extracted job description
+                job["token_cost"],         # Associated cost in tokens for the job
+                task.start_time,           # Scraping process start time
+                task.end_time,             # Scraping process end time
+                make_abs_url(response.url, job.get("job_page_url",'')),       # Extracted job page url
+                response.url               # Source of the job
+            )
+            for job in task.jobs  # Loop through each job extracted
+        ]
+
+        # Queue the source's jobs for the table; the buffer writes many sources per transaction, and only what changed.
+        # A partial extraction is written without its fingerprint, so the next crawl extracts the page again
+        if task.failed:
+            logger.warning(f"Extraction failed for {task.failed} chunks, not caching the extraction: {response.url}")
+        self.writer.add(task.table, response.url, records, fingerprint=None if task.failed else task.fingerprint, jobs=task.jobs)
+
+
+    def run(self, pages: List[Tuple[int, str]]) -> Dict:
+        """
+        Crawls the given pages and writes their jobs, flushing the write buffer at the end.
+
+        Args:
+            pages (list): The (client_id, url) pairs to crawl.
+
+        Returns:
+            dict: The stats of each pipeline step, see `Pipeline.stats`.
+        """
+        self.paths = Counter()
+
+        # Steps run concurrently, connected by bounded queues
+        self._pipeline = Pipeline([
+            Stage("clean", self.clean, workers=2, queue_size=16),
+            Stage("extract", self.extract, workers=4, queue_size=16),
+            Stage("write", self.write, workers=1, queue_size=64),
+        ], source_name="fetch")
+
+        # Fetch several pages at once and feed them to the pipeline as they complete
+        fetched = self.crawler.fetch_concurrent(pages, concurrency=self.concurrency, per_host=self.per_host, min_delay=self.min_delay)
+        try:
+            stats = self._pipeline.run(PageTask(client_id, response, table=self.table) for client_id, response in fetched)
+            stats["fetch"]["failed"] = self.crawler.failed
+        finally:
+            # Stop the crawl, then write what is still buffered, also when stopped by SIGTERM or Ctrl+C
+            fetched.close()
+            self.writer.flush()
+            self._pipeline = None
+
+        # Report which extraction path served the pages
+        logger.info(f"Extraction paths ({self.table}): " + ", ".join(f"{path} {count}" for path, count in self.paths.most_common()))
+        return stats
+
+
+    def stop(self) -> None:
+        """
+        Stops feeding the running crawl into the pipeline; fetched pages are still written.
+
+        Returns:
+            None
+        """
+        pipeline = self._pipeline
+        if pipeline is not None:
+            pipeline.stop()
+
+
+
+def log_summary(mysql: DB, agent: Agent, writers: List[WriteBuffer], responses: ResponseCache) -> None:
+    """
+    Logs the counters of the components shared by the stages.
+
+    Args:
+        mysql (DB): The database.
+        agent (Agent): The agent, with its chunk cache.
+        writers (list): The write-behind buffers.
+        responses (ResponseCache): The response cache.
+
+    Returns:
+        None
+    """
+    # Report how fast the job records were written
+    for writer in writers:
+        write_stats = writer.stats()
+        logger.info(f"Writes: {write_stats['rows']} rows in {write_stats['flushes']} flushes, {write_stats['rows_per_second']} rows/s, {write_stats['average_flush_seconds']}s average / {write_stats['max_flush_seconds']}s max flush, {write_stats['inserted']} new, {write_stats['updated']} updated, {write_stats['deleted']} removed, {write_stats['unchanged']} unchanged")
+
+    # Report how many chunks were served from the cache
+    if agent.cache is not None:
+        cache_stats = agent.cache.stats()
+        logger.info(f"Chunk cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_ratio']:.0%}), {cache_stats['tokens_saved']} tokens saved")
+
+    # Report how many pages were revalidated instead of downloaded and rendered
+    if responses is not None:
+        response_stats = responses.stats()
+        logger.info(f"Response cache: {response_stats['hits']} hits, {response_stats['not_modified']} not modified, {response_stats['evictions']} evictions, {response_stats['bytes']} bytes")
+
+    # Report how many tokens pruning kept away from the model
+    pruning = agent.pruning_summary()
+    logger.info(f"Pruning: {pruning['pages']} pages, {pruning['sampled']} sampled, {pruning['tokens_before']} -> {pruning['tokens_after']} tokens ({pruning['saved']:.0%} saved)")
+
+    # Report where the agent spent its time
+    timings = agent.timing_summary()
+    logger.info("Agent time: " + ", ".join(f"{step} {timing['calls']} calls, {timing['seconds']}s ({timing['average_ms']} ms average)" for step, timing in timings.items()))
+
+    # Report how the connection pool held up
+    pool_stats = mysql.pool.stats()
+    logger.info(f"DB pool: {pool_stats['size']} open, {pool_stats['opened']} opened, {pool_stats['reconnects']} reconnects")
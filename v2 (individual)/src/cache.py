@@ -0,0 +1,302 @@
+from typing import Any, Dict, Optional
+import hashlib
+import sqlite3
+import threading
+import json
+import time
+import os
+
+from src.logger import logger
+
+
+
+class LRUCache:
+    """
+    A key/value store in SQLite with size-based LRU eviction.
+
+    Values are stored as JSON. When the stored values exceed `max_bytes`, the
+    least recently used entries are evicted. Safe to share between threads.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        """
+        Opens or creates the cache.
+
+        Args:
+            path (str): The SQLite file.
+            max_bytes (int): The total size of stored values before eviction.
+
+        Returns:
+            None
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries
+            (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            size INTEGER,
+            accessed REAL
+            )
+            """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Looks up a value and marks it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return json.loads(row[0])
+
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Stores a value, evicting least recently used entries if the cache is full.
+
+        Args:
+            key (str): The cache key.
+            value: The JSON-serializable value.
+
+        Returns:
+            None
+        """
+        data = json.dumps(value)
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._size += len(data) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+
+    def _evict(self) -> None:
+        # drop the oldest entries until the cache is back to 90% of its budget
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+        logger.info(f"{type(self).__name__}: evicted {len(evicted)} entries")
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, hit ratio, evictions and stored bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._size,
+            }
+
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters, e.g. at the start of a run.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+    def close(self) -> None:
+        """
+        Closes the SQLite connection.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._db.close()
+
+
+
+class ChunkCache(LRUCache):
+    """
+    An on-disk cache of extraction results per text chunk.
+
+    Entries are keyed by a hash of the model, the extraction schema and the chunk
+    text, see `key`.
+    """
+
+    def __init__(self, path: str = ".cache/chunks.sqlite", max_bytes: int = 256 * 1024 * 1024) -> None:
+        """
+        Opens or creates the cache.
+
+        Args:
+            path (str): The SQLite file. Defaults to ".cache/chunks.sqlite".
+            max_bytes (int): The total size of stored values before eviction. Defaults to 256 MB.
+
+        Returns:
+            None
+        """
+        super().__init__(path, max_bytes)
+        self.tokens_saved = 0
+
+
+    @staticmethod
+    def key(model: str, schema: Dict, text: str) -> str:
+        """
+        Builds the cache key of a chunk.
+
+        Args:
+            model (str): The model name.
+            schema (dict): The extraction schema.
+            text (str): The chunk text.
+
+        Returns:
+            str: The hex SHA-256 digest of the three.
+        """
+        payload = json.dumps([model, schema, text], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+    def saved(self, tokens: int) -> None:
+        """
+        Records the tokens a cache hit saved.
+
+        Args:
+            tokens (int): The token count of the cached chunk.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.tokens_saved += tokens
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, hit ratio, evictions, stored bytes and tokens saved.
+        """
+        stats = super().stats()
+        with self._lock:
+            return {**stats, "tokens_saved": self.tokens_saved}
+
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters, e.g. at the start of a run.
+
+        Returns:
+            None
+        """
+        super().reset_stats()
+        with self._lock:
+            self.tokens_saved = 0
+
+
+
+class ResponseCache(LRUCache):
+    """
+    An on-disk HTTP cache of page bodies and their validators (ETag, Last-Modified), keyed by URL.
+    """
+
+    def __init__(self, path: str = ".cache/responses.sqlite", max_bytes: int = 512 * 1024 * 1024) -> None:
+        """
+        Opens or creates the cache.
+
+        Args:
+            path (str): The SQLite file. Defaults to ".cache/responses.sqlite".
+            max_bytes (int): The total size of stored values before eviction. Defaults to 512 MB.
+
+        Returns:
+            None
+        """
+        super().__init__(path, max_bytes)
+        self.not_modified = 0
+
+
+    def store(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """
+        Stores a page body if the server sent validators for it.
+
+        Args:
+            url (str): The URL of the page.
+            body (str): The page HTML.
+            etag (str): The ETag header, if any.
+            last_modified (str): The Last-Modified header, if any.
+
+        Returns:
+            None
+        """
+        if etag or last_modified:
+            self.put(url, {"body": body, "etag": etag, "last_modified": last_modified})
+
+
+    def revalidated(self) -> None:
+        """
+        Records a 304 Not Modified answer to a conditional request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.not_modified += 1
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, hit ratio, evictions, stored bytes and 304 answers.
+        """
+        stats = super().stats()
+        with self._lock:
+            return {**stats, "not_modified": self.not_modified}
+
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters, e.g. at the start of a run.
+
+        Returns:
+            None
+        """
+        super().reset_stats()
+        with self._lock:
+            self.not_modified = 0
@@ -0,0 +1,180 @@
+from bs4 import BeautifulSoup, Tag
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+import json
+
+from src.crawler import Response
+from src.logger import logger
+
+
+# Deterministic extractors, tried in order before the LLM
+EXTRACTORS: List[Tuple[str, Callable[[Response, BeautifulSoup], List[Dict]]]] = []
+
+
+def register(name: str) -> Callable:
+    """
+    Registers an extractor under a name.
+
+    An extractor takes the response and its parsed HTML and returns the jobs
+    it found as `job_title`/`job_description`/`job_page_url` dicts, or an empty
+    list when it does not apply to the page.
+
+    Args:
+        name (str): The name recorded as the extraction path.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(fn: Callable) -> Callable:
+        EXTRACTORS.append((name, fn))
+        return fn
+    return decorator
+
+
+def _text(node, separator: str = " ") -> str:
+    if node is None:
+        return ""
+    if isinstance(node, str):
+        node = BeautifulSoup(node, "html.parser")
+    return " ".join(node.get_text(separator).split())
+
+
+def _job(title: str, description: str, url: str) -> Dict:
+    return {"job_title": title.strip(), "job_description": description.strip(), "job_page_url": url or ""}
+
+
+def _host_matches(response: Response, *domains: str) -> bool:
+    host = urlparse(response.url).netloc.lower()
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def _json_ld_nodes(soup: BeautifulSoup) -> Iterator[Dict]:
+    # walk every JSON-LD block, unwrapping lists, @graph and ItemList entries
+    stack = []
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            stack.append(json.loads(script.string or ""))
+        except ValueError:
+            continue
+    while stack:
+        node = stack.pop(0)
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            yield node
+            stack.extend(node[key] for key in ("@graph", "itemListElement", "item") if key in node)
+
+
+def _is_type(node: Dict, name: str) -> bool:
+    types = node.get("@type")
+    return name in (types if isinstance(types, list) else [types])
+
+
+@register("json-ld")
+def json_ld(response: Response, soup: BeautifulSoup) -> List[Dict]:
+    """
+    Extracts schema.org JobPosting objects from JSON-LD blocks.
+    """
+    jobs = []
+    for node in _json_ld_nodes(soup):
+        if _is_type(node, "JobPosting") and node.get("title"):
+            url = node.get("url") or node.get("sameAs") or response.url
+            jobs.append(_job(node["title"], _text(str(node.get("description") or "")), urljoin(response.url, url)))
+    return jobs
+
+
+@register("microdata")
+def microdata(response: Response, soup: BeautifulSoup) -> List[Dict]:
+    """
+    Extracts schema.org JobPosting items from microdata attributes.
+    """
+    jobs = []
+    for item in soup.find_all(itemtype=lambda value: value and "schema.org/JobPosting" in value):
+        title = item.find(itemprop="title")
+        if title is None:
+            continue
+        description = item.find(itemprop="description")
+        link = item.find(itemprop="url")
+        url = (link.get("href") or link.get("content")) if link is not None else None
+        jobs.append(_job(_text(title), _text(description), urljoin(response.url, url or response.url)))
+    return jobs
+
+
+@register("greenhouse")
+def greenhouse(response: Response, soup: BeautifulSoup) -> List[Dict]:
+    """
+    Extracts the openings of a Greenhouse job board.
+    """
+    if not _host_matches(response, "greenhouse.io"):
+        return []
+    jobs = []
+    for opening in soup.select("div.opening, tr.job-post"):
+        link = opening.find("a", href=True)
+        if link is None:
+            continue
+        location = opening.select_one(".location, p.body--metadata")
+        title = link.find("p", class_="body--medium") or link
+        jobs.append(_job(_text(title), _text(location), urljoin(response.url, link["href"])))
+    return jobs
+
+
+@register("lever")
+def lever(response: Response, soup: BeautifulSoup) -> List[Dict]:
+    """
+    Extracts the postings of a Lever job board, or the posting of a Lever job page.
+    """
+    if not _host_matches(response, "lever.co"):
+        return []
+    jobs = []
+    for posting in soup.select("div.posting"):
+        link = posting.select_one("a.posting-title")
+        title = posting.select_one("[data-qa=posting-name], h5")
+        if link is None or title is None:
+            continue
+        jobs.append(_job(_text(title), _text(posting.select_one(".posting-categories")), urljoin(response.url, link.get("href", ""))))
+    headline = soup.select_one("div.posting-headline h2")
+    if not jobs and headline is not None:
+        sections = soup.select("div.section-wrapper div.section")
+        jobs.append(_job(_text(headline), " ".join(_text(section, "\n") for section in sections), response.url))
+    return jobs
+
+
+@register("workday")
+def workday(response: Response, soup: BeautifulSoup) -> List[Dict]:
+    """
+    Extracts the jobs of a rendered Workday job board, or the job of a Workday job page.
+    """
+    if not _host_matches(response, "myworkdayjobs.com", "myworkdaysite.com"):
+        return []
+    jobs = []
+    for link in soup.select("a[data-automation-id=jobTitle]"):
+        row = link.find_parent("li") or link.parent
+        location = row.select_one("[data-automation-id=locations]") if isinstance(row, Tag) else None
+        jobs.append(_job(_text(link), _text(location), urljoin(response.url, link.get("href", ""))))
+    header = soup.select_one("[data-automation-id=jobPostingHeader]")
+    if not jobs and header is not None:
+        description = soup.select_one("[data-automation-id=jobPostingDescription]")
+        jobs.append(_job(_text(header), _text(description, "\n"), response.url))
+    return jobs
+
+
+def extract(response: Response) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Runs the registered extractors in order and returns the first non-empty result.
+
+    Args:
+        response: The response object containing the page HTML.
+
+    Returns:
+        tuple: The name of the extractor that matched and its jobs, or (None, []) if none did.
+    """
+    soup = BeautifulSoup(response.text, "html.parser")
+    for name, extractor in EXTRACTORS:
+        try:
+            jobs = [job for job in extractor(response, soup) if job["job_title"]]
+        except Exception as e:
+            logger.error(f"Extractor {name} failed on {response.url}: {e!r}")
+            continue
+        if jobs:
+            return name, jobs
+    return None, []
@@ -0,0 +1,62 @@
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from typing import AsyncIterator, Dict
+import asyncio
+
+
+
+class HostLimiter:
+    """
+    Politeness limits for concurrent crawling.
+
+    Caps the number of fetches in flight overall and per host, and spaces out
+    the start of consecutive fetches to the same host by `min_delay` seconds.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, concurrency: int = 8, per_host: int = 2, min_delay: float = 1.0) -> None:
+        """
+        Initializes the limiter.
+
+        Args:
+            concurrency (int): The maximum number of fetches in flight. Defaults to 8.
+            per_host (int): The maximum number of fetches in flight per host. Defaults to 2.
+            min_delay (float): The minimum number of seconds between two fetches to the same host. Defaults to 1.0.
+
+        Returns:
+            None
+        """
+        self.per_host = per_host
+        self.min_delay = min_delay
+        self._global = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+
+    async def _wait_turn(self, host: str) -> None:
+        # reserve the next start time for the host before sleeping, so
+        # concurrent waiters line up one min_delay apart
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.min_delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """
+        Waits until the URL may be fetched and holds its slot while in use.
+
+        Args:
+            url (str): The URL about to be fetched.
+
+        Yields:
+            None
+        """
+        host = urlparse(url).netloc.lower()
+        semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with semaphore:
+            await self._wait_turn(host)
+            async with self._global:
+                yield
@@ -0,0 +1,84 @@
+from typing import Dict
+import threading
+import time
+
+
+
+class RateLimiter:
+    """
+    A token-bucket scheduler for the model's requests-per-minute and tokens-per-minute budgets.
+
+    Callers reserve one request and their estimated token count before each
+    call and block until both buckets can cover it, so concurrent callers
+    share the quota without running into 429 responses. Safe to share between
+    threads.
+    """
+
+    def __init__(self, requests_per_minute: int = 3500, tokens_per_minute: int = 90000) -> None:
+        """
+        Initializes the limiter with full buckets.
+
+        Args:
+            requests_per_minute (int): The request budget. Defaults to 3500.
+            tokens_per_minute (int): The token budget. Defaults to 90000.
+
+        Returns:
+            None
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self.calls = 0
+        self.tokens = 0
+        self.waited = 0.0
+
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Blocks until the budget covers one request of the given size, then reserves it.
+
+        Args:
+            tokens (int): The estimated prompt and completion tokens of the request.
+
+        Returns:
+            float: The seconds spent waiting.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    break
+                missing_requests = max(0.0, 1 - self._requests) * 60 / self.requests_per_minute
+                missing_tokens = max(0.0, tokens - self._tokens) * 60 / self.tokens_per_minute
+                self._condition.wait(max(missing_requests, missing_tokens))
+            self._requests -= 1
+            self._tokens -= tokens
+            waited = time.monotonic() - started
+            self.calls += 1
+            self.tokens += tokens
+            self.waited += waited
+        return waited
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the limiter counters.
+
+        Returns:
+            dict: Calls and tokens reserved, and the total seconds callers waited.
+        """
+        with self._condition:
+            return {"calls": self.calls, "tokens": self.tokens, "waited_seconds": round(self.waited, 1)}
@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+
+
+
+@dataclass
+class RecrawlPolicy:
+    """
+    Adapts the recrawl interval of a page to how often it changes.
+
+    The outcome of the last `history` crawls is kept per page as a string of
+    "1" (the jobs or the page text changed) and "0" (unchanged). After each
+    crawl the interval is scaled so that about `target_change_rate` of the
+    crawls find a change: pages that change on most crawls are visited more
+    often, pages that never change less often, by at most a factor of two
+    per crawl and always within [min_hours, max_hours].
+    """
+
+    min_hours: float = 1.0
+    max_hours: float = 24.0 * 14
+    history: int = 8
+    target_change_rate: float = 0.5
+
+
+    def record(self, history: str, changed: bool) -> str:
+        """
+        Appends the outcome of a crawl to a change history.
+
+        Args:
+            history (str): The outcomes of the previous crawls, oldest first.
+            changed (bool): Whether the crawl found a change.
+
+        Returns:
+            str: The last `history` outcomes.
+        """
+        return (history + ("1" if changed else "0"))[-self.history:]
+
+
+    def next_interval(self, hours: float, history: str) -> float:
+        """
+        Computes the interval until the next crawl.
+
+        Args:
+            hours (float): The current interval in hours.
+            history (str): The change history, see `record`.
+
+        Returns:
+            float: The new interval in hours.
+        """
+        rate = history.count("1") / len(history) if history else self.target_change_rate
+        factor = self.target_change_rate / rate if rate else 2.0
+        factor = min(2.0, max(0.5, factor))
+        return round(min(self.max_hours, max(self.min_hours, hours * factor)), 2)
@@ -0,0 +1,171 @@
+from typing import Callable, Dict, Optional
+import threading
+import time
+
+from src.db import DB
+from src.runner import StageRunner
+from src import metrics
+from src.logger import logger
+
+
+
+class Scheduler:
+    """
+    Feeds a stage from a persistent crawl queue, one batch at a time.
+
+    The queue table orders pages by their next due time, see `DB.claim_queue`.
+    As soon as a batch is written the next due pages are claimed, so a backlog
+    is worked off continuously while runs never overlap. When nothing is due,
+    the scheduler sleeps until the next page is, or until `wake()` is called.
+    """
+
+    def __init__(self, mysql: DB, stage: StageRunner, queue: str, batch_size: int = 100, idle: float = 60.0, sync: Optional[Callable[[], int]] = None, sync_every: float = 300.0, on_batch: Optional[Callable[[], None]] = None) -> None:
+        """
+        Initializes the scheduler.
+
+        Args:
+            mysql (DB): The database holding the queue.
+            stage (StageRunner): The stage crawling the claimed pages.
+            queue (str): The crawl queue, "url_schedule" or "job_queue".
+            batch_size (int): The maximum number of pages per batch. Defaults to 100.
+            idle (float): The longest sleep, in seconds, when nothing is due. Defaults to 60.0.
+            sync (callable, optional): Adds new pages to the queue, e.g. `DB.sync_url_schedule`. Defaults to None.
+            sync_every (float): The seconds between two calls of `sync`. Defaults to 300.0.
+            on_batch (callable, optional): Called after each batch, e.g. to log a summary. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.mysql = mysql
+        self.stage = stage
+        self.queue = queue
+        self.batch_size = batch_size
+        self.idle = idle
+        self.sync = sync
+        self.sync_every = sync_every
+        self.on_batch = on_batch
+        self.batches = 0
+        self.pages = 0
+        self.last_batch_seconds = 0.0
+        self.backlog = 0
+        self.lag_seconds = None
+        self._synced = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+
+    def wake(self) -> None:
+        """
+        Ends the current sleep, e.g. when pages were just queued.
+
+        Returns:
+            None
+        """
+        self._wake.set()
+
+
+    def stop(self) -> None:
+        """
+        Stops after the running batch; its fetched pages are still written.
+
+        Returns:
+            None
+        """
+        self._stopping.set()
+        self._wake.set()
+        self.stage.stop()
+
+
+    def run_once(self) -> int:
+        """
+        Claims and crawls one batch of due pages.
+
+        Returns:
+            int: The number of pages claimed.
+        """
+        if self.sync is not None and (self._synced is None or time.monotonic() - self._synced >= self.sync_every):
+            added = self.sync()
+            self._synced = time.monotonic()
+            if added:
+                logger.info(f"Scheduled {added} new pages in {self.queue}")
+
+        pages = self.mysql.claim_queue(limit=self.batch_size, queue=self.queue)
+        if pages:
+            started = time.monotonic()
+            self.stage.run(pages)
+            self.last_batch_seconds = time.monotonic() - started
+            self.batches += 1
+            self.pages += len(pages)
+        self.measure()
+        if pages:
+            self.log_stats()
+            if self.on_batch is not None:
+                self.on_batch()
+        return len(pages)
+
+
+    def _sleep_seconds(self) -> float:
+        # sleep until the next page is due, but at most `idle` seconds
+        if self.lag_seconds is None or self.lag_seconds >= 0:
+            return self.idle
+        return min(-self.lag_seconds, self.idle)
+
+
+    def run(self) -> None:
+        """
+        Crawls due pages until `stop()` is called.
+
+        Returns:
+            None
+        """
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Scheduler of {self.queue} failed: {e!r}")
+            self._wake.wait(timeout=self._sleep_seconds())
+            self._wake.clear()
+
+
+    def measure(self) -> Dict:
+        """
+        Refreshes the backlog and lag of the queue, see `DB.queue_stats`, and publishes them as gauges.
+
+        Returns:
+            dict: The backlog and lag in seconds.
+        """
+        stats = self.mysql.queue_stats(self.queue)
+        self.backlog, self.lag_seconds = stats["backlog"], stats["lag_seconds"]
+        metrics.QUEUE_BACKLOG.set(self.backlog, queue=self.queue)
+        metrics.QUEUE_LAG.set(self.lag_seconds, queue=self.queue)
+        return stats
+
+
+    def stats(self) -> Dict:
+        """
+        Returns the scheduler counters.
+
+        Returns:
+            dict: The batches and pages crawled, the duration of the last batch, and the backlog and lag at its end.
+        """
+        return {
+            "batches": self.batches,
+            "pages": self.pages,
+            "last_batch_seconds": round(self.last_batch_seconds, 1),
+            "backlog": self.backlog,
+            "lag_seconds": self.lag_seconds,
+        }
+
+
+    def log_stats(self) -> None:
+        """
+        Logs the scheduler counters.
+
+        Returns:
+            None
+        """
+        stats = self.stats()
+        lag = stats["lag_seconds"]
+        behind = f"{lag}s behind" if lag is not None and lag >= 0 else "up to date"
+        logger.info(f"Scheduler ({self.queue}): {stats['pages']} pages in {stats['batches']} batches, last {stats['last_batch_seconds']}s, backlog {stats['backlog']}, {behind}")
@@ -0,0 +1,254 @@
+from typing import Callable, List, Tuple
+import pymysql.cursors
+
+from src.logger import logger
+
+
+# The jobs tables, one per crawl stage
+JOB_TABLES = ["overview", "individual"]
+
+# Crawl queues and the column holding their URLs
+QUEUES = {"url_schedule": "url", "job_queue": "job_page_url"}
+
+# Serializes migrations between the overview and individual processes
+LOCK_NAME = "jobs_schema_migration"
+
+
+def _jobs_table(table: str) -> str:
+    return f"""CREATE TABLE IF NOT EXISTS {table}
+        (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        client_id INT,
+        title VARCHAR(255),
+        description TEXT,
+        token_cost VARCHAR(255),
+        scraping_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        scraping_end_time TIMESTAMP,
+        job_page_url VARCHAR(255),
+        source VARCHAR(255)
+        )
+        """
+
+
+def _has_index(cursor, table: str, name: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s;
+    """, (table, name))
+    return bool(cursor.fetchone().get("found"))
+
+
+def _has_column(cursor, table: str, column: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s;
+    """, (table, column))
+    return bool(cursor.fetchone().get("found"))
+
+
+def _primary_key(cursor, table: str) -> List[str]:
+    cursor.execute("""
+        SELECT column_name AS name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = 'PRIMARY'
+        ORDER BY seq_in_index;
+    """, (table,))
+    return [row.get("name") for row in cursor.fetchall()]
+
+
+def _create_index(cursor, table: str, name: str, columns: str) -> None:
+    # MySQL has no CREATE INDEX IF NOT EXISTS
+    if not _has_index(cursor, table, name):
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({columns});")
+
+
+def _base_tables(cursor) -> None:
+    cursor.execute("""CREATE TABLE IF NOT EXISTS urls
+        (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        client_id INT,
+        url VARCHAR(255)
+        )
+        """)
+    for table in JOB_TABLES:
+        cursor.execute(_jobs_table(table))
+    cursor.execute("""CREATE TABLE IF NOT EXISTS fingerprints
+        (
+        table_name VARCHAR(64),
+        source VARCHAR(255),
+        fingerprint CHAR(64),
+        jobs LONGTEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (table_name, source)
+        )
+        """)
+    cursor.execute("""CREATE TABLE IF NOT EXISTS fetch_tiers
+        (
+        host VARCHAR(255) PRIMARY KEY,
+        tier VARCHAR(16),
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """)
+
+
+def _column_types(cursor) -> None:
+    # URLs longer than 255 characters were truncated; 768 characters is the
+    # longest utf8mb4 column InnoDB can still index. A second TIMESTAMP column
+    # without a default is implicitly NOT NULL DEFAULT '0000-00-00' on older
+    # servers, so the end time is made explicitly nullable. The urls table
+    # belongs to the clients and is left as it is.
+    for table in JOB_TABLES:
+        cursor.execute(f"""ALTER TABLE {table}
+            MODIFY description MEDIUMTEXT,
+            MODIFY scraping_end_time TIMESTAMP NULL DEFAULT NULL,
+            MODIFY job_page_url VARCHAR(768),
+            MODIFY source VARCHAR(768);
+        """)
+
+
+def _indexes(cursor) -> None:
+    # URL columns are indexed on a prefix to stay within InnoDB's 3072-byte key limit
+    for table in JOB_TABLES:
+        _create_index(cursor, table, f"idx_{table}_freshness", "source(255), scraping_end_time")
+        _create_index(cursor, table, f"idx_{table}_client", "client_id")
+        _create_index(cursor, table, f"idx_{table}_end_time", "scraping_end_time")
+        _create_index(cursor, table, f"idx_{table}_job_page_url", "job_page_url(255)")
+
+
+def _job_queue(cursor) -> None:
+    # Job pages found by the overview stage for the individual stage, one row
+    # per distinct URL whichever clients list it; seeded from the overview table
+    cursor.execute("""CREATE TABLE IF NOT EXISTS job_queue
+        (
+        url_hash CHAR(64) PRIMARY KEY,
+        job_page_url VARCHAR(768) NOT NULL,
+        client_id INT,
+        discovered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP NULL DEFAULT NULL,
+        due_at TIMESTAMP NULL DEFAULT NULL,
+        claimed_until TIMESTAMP NULL DEFAULT NULL,
+        crawled_at TIMESTAMP NULL DEFAULT NULL,
+        INDEX idx_job_queue_due (due_at)
+        )
+        """)
+    cursor.execute("""
+        INSERT IGNORE INTO job_queue (url_hash, job_page_url, client_id, last_seen, due_at)
+        SELECT SHA2(job_page_url, 256), job_page_url, MIN(client_id), NOW(), NOW() FROM overview
+        WHERE job_page_url IS NOT NULL AND job_page_url <> '' AND job_page_url <> source
+        GROUP BY job_page_url;
+    """)
+
+
+def _url_schedule(cursor) -> None:
+    # The websites of the urls table in the order the overview stage is due
+    # to crawl them, filled by DB.sync_url_schedule
+    cursor.execute("""CREATE TABLE IF NOT EXISTS url_schedule
+        (
+        url_hash CHAR(64) PRIMARY KEY,
+        url VARCHAR(768) NOT NULL,
+        client_id INT,
+        due_at TIMESTAMP NULL DEFAULT NULL,
+        claimed_until TIMESTAMP NULL DEFAULT NULL,
+        crawled_at TIMESTAMP NULL DEFAULT NULL,
+        INDEX idx_url_schedule_due (due_at)
+        )
+        """)
+
+
+def _recrawl_intervals(cursor) -> None:
+    # Per-page recrawl interval and the outcome of its last crawls, see RecrawlPolicy
+    for queue in QUEUES:
+        cursor.execute(f"""ALTER TABLE {queue}
+            ADD COLUMN recrawl_hours FLOAT NULL DEFAULT NULL,
+            ADD COLUMN change_history VARCHAR(32) NOT NULL DEFAULT '';
+        """)
+
+
+def _fingerprint_source_hash(cursor) -> None:
+    # Widens the source like the jobs tables. (table_name, source) at 768
+    # characters exceeds InnoDB's 3072-byte key limit, so the rows are keyed
+    # by the SHA-256 of the source instead, like the crawl queues.
+    # DDL commits implicitly, so every step checks whether it already ran.
+    if not _has_column(cursor, "fingerprints", "source_hash"):
+        cursor.execute("ALTER TABLE fingerprints ADD COLUMN source_hash CHAR(64) NULL AFTER table_name;")
+    if _primary_key(cursor, "fingerprints") != ["table_name", "source_hash"]:
+        cursor.execute("UPDATE fingerprints SET source_hash = SHA2(source, 256) WHERE source_hash IS NULL;")
+        cursor.execute("""ALTER TABLE fingerprints
+            DROP PRIMARY KEY,
+            MODIFY source_hash CHAR(64) NOT NULL,
+            MODIFY source VARCHAR(768),
+            ADD PRIMARY KEY (table_name, source_hash);
+        """)
+
+
+def _fetch_tiers_per_stage(cursor) -> None:
+    # The stages fetch different pages of the same hosts, e.g. a server-rendered
+    # job page behind a JavaScript job board, so each learns its own tiers.
+    # Known tiers are kept for the overview stage; the individual stage relearns.
+    # DDL commits implicitly, so every step checks whether it already ran.
+    if not _has_column(cursor, "fetch_tiers", "stage"):
+        cursor.execute("ALTER TABLE fetch_tiers ADD COLUMN stage VARCHAR(32) NOT NULL DEFAULT 'overview' FIRST;")
+    if _primary_key(cursor, "fetch_tiers") != ["stage", "host"]:
+        cursor.execute("ALTER TABLE fetch_tiers DROP PRIMARY KEY, ADD PRIMARY KEY (stage, host);")
+
+
+def _drop_urls_index(cursor) -> None:
+    # The urls table belongs to the clients; no query needs the index on it
+    if _has_index(cursor, "urls", "idx_urls_client"):
+        cursor.execute("DROP INDEX idx_urls_client ON urls;")
+
+
+# Schema versions, applied in order and recorded in schema_migrations.
+# Append new steps; never edit or reorder applied ones.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base tables", _base_tables),
+    (2, "column types", _column_types),
+    (3, "indexes", _indexes),
+    (4, "job queue", _job_queue),
+    (5, "url schedule", _url_schedule),
+    (6, "recrawl intervals", _recrawl_intervals),
+    (7, "fingerprint source hash", _fingerprint_source_hash),
+    (8, "fetch tiers per stage", _fetch_tiers_per_stage),
+    (9, "drop urls index", _drop_urls_index),
+]
+
+
+def migrate(connection: pymysql.connections.Connection) -> int:
+    """
+    Brings the database schema up to date.
+
+    Applies the steps of MIGRATIONS that are newer than the recorded version,
+    under a named lock so that concurrent processes apply each step once.
+    Meant to run once at startup; the DB methods then only run DML.
+
+    Args:
+        connection: A connection to the jobs database.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    cursor.execute("SELECT GET_LOCK(%s, 60) AS locked;", (LOCK_NAME,))
+    if not cursor.fetchone().get("locked"):
+        raise RuntimeError("Timed out waiting for the schema migration lock")
+    try:
+        cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations
+            (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+        cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations;")
+        version = cursor.fetchone().get("version")
+        for step, description, apply in MIGRATIONS:
+            if step <= version:
+                continue
+            logger.info(f"Migrating schema to version {step}: {description}")
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s);", (step, description))
+            connection.commit()
+            version = step
+        return version
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s);", (LOCK_NAME,))
+        cursor.close()
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prune import prune
+
+
+JOBS = "".join(f'<li class="job"><a href="/jobs/{i}">Engineer {i}</a> Build the platform of team {i}.</li>' for i in range(5))
+
+
+def test_consent_class_on_body_keeps_the_page():
+    html = f'<html><body class="cookie-consent-pending"><ul>{JOBS}</ul></body></html>'
+    pruned = prune(html)
+    assert "Engineer 0" in pruned
+    assert "Engineer 4" in pruned
+
+
+def test_consent_class_on_app_wrapper_keeps_the_page():
+    html = f'<html><body><div id="app" class="gdpr-pending"><ul>{JOBS}</ul></div></body></html>'
+    assert "Engineer 2" in prune(html)
+
+
+def test_cookie_banner_is_dropped():
+    html = f'<html><body><div id="cookie-banner">We use cookies to improve your experience.</div><ul>{JOBS}</ul></body></html>'
+    pruned = prune(html)
+    assert "cookies" not in pruned
+    assert "Engineer 3" in pruned